@@ -6,26 +6,81 @@
 # ------------------------------------------------------------------------------
 from copy import deepcopy
 
-from config import *
-
+import numpy as np
 
-def build_match(x, att_info, dtype, random_func):
-    if dtype:
-        att_range = att_info[1] - att_info[0]
-        radius_l = random_func.randint(25, 75) * 0.01 * (att_range / 2.0)
-        radius_r = random_func.randint(25, 75) * 0.01 * (att_range / 2.0)
-        return [max(att_info[0], (x - radius_l)), min(att_info[1], x + radius_r)]
-    elif not dtype:
-        return x
-    else:
-        print("attribute type unidentified!")
+from config import *
+from label_set import LabelSet
+from population_store import COLUMNS
+
+
+def cover_bounds(state, count, att_low, att_high, continuous, rng):
+    """
+    (lower, upper, specified) arrays of count covering conditions for state, drawn at once. Each attribute
+    is specified with probability 1 - PROB_HASH, rows left without any are redrawn; a continuous interval
+    reaches 25-75% of half the attribute range on either side of the value, clipped to the range, and a
+    discrete one is the value itself.
+    """
+    x = np.asarray(state, dtype=float)
+    n = x.__len__()
+    tries = 1 + int(10 * PROB_HASH ** n)  # attempts drawn per rule up front, so that few end up redrawn
+    draws = rng.random((count, tries + 2, n))
+    attempts = draws[:, :tries] < (1 - PROB_HASH)
+    hits = attempts.any(axis=2)
+    specified = attempts[np.arange(count), hits.argmax(axis=1)]
+    if not hits.any(axis=1).all():
+        for rule in np.flatnonzero(~hits.any(axis=1)).tolist():
+            while not specified[rule].any():
+                specified[rule] = rng.random(n) < (1 - PROB_HASH)
+    radius = (25 + np.floor(draws[:, tries:] * 51)) * ((att_high - att_low) * 0.005)  # 25..75% of half range
+    lower = np.where(specified, np.where(continuous, np.maximum(att_low, x - radius[:, 0]), x), -np.inf)
+    upper = np.where(specified, np.where(continuous, np.minimum(att_high, x + radius[:, 1]), x), np.inf)
+    return lower, upper, specified
+
+
+class Column:
+    """
+    Classifier parameter held in the population store while the classifier is bound to it. Writes go through
+    the store, which keeps its population totals current; writes to tracked columns also mark the row dirty
+    so the store's deletion votes get refreshed.
+    """
+    def __init__(self, cast=float, tracked=False):
+        self.cast = cast
+        self.tracked = tracked
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.local = '_' + name
+
+    def __get__(self, classifier, owner=None):
+        if classifier is None:
+            return self
+        if classifier.store is None:
+            return classifier.__dict__[self.local]
+        return self.cast(getattr(classifier.store, self.name)[classifier.row])
+
+    def __set__(self, classifier, value):
+        if classifier.store is None:
+            classifier.__dict__[self.local] = value
+        else:
+            classifier.store.write(self.name, classifier.row, value, self.tracked)
 
 
 class Classifier:
+    numerosity = Column(int, tracked=True)
+    match_count = Column(int, tracked=True)
+    loss = Column()
+    fitness = Column(tracked=True)
+    ave_matchset_size = Column(tracked=True)
+    init_time = Column(int)
+    ga_time = Column(int)
+
     def __init__(self):
+        self.store = None
+        self.row = None
+        self.shared = None
         self.specified_atts = []
         self.condition = []
-        self.prediction = set()
+        self.prediction = LabelSet()
         self.parent_prediction = []
         self.numerosity = 1
         self.match_count = 0
@@ -38,24 +93,86 @@ class Classifier:
         self.ga_time = 0
         self.deletion_vote = 0.0
 
-    def classifier_cover(self, set_size, it, state, target, attribute_info, dtypes, random_func):
+    # conditions read from the store or a RuleCondition list their attributes in increasing order, whatever
+    # order they were built in; positional comparisons and the GA operators see that order
+    @property
+    def specified_atts(self):
+        if self.store is not None:
+            return self.store.specified_atts(self.row)
+        if self.shared is not None:
+            return self.shared.lists()[0]
+        return self._specified_atts
+
+    @specified_atts.setter
+    def specified_atts(self, atts):
+        if self.store is not None:
+            raise Exception('condition of a classifier in the population is read-only!')
+        self.unshare()
+        self._specified_atts = atts
+
+    @property
+    def condition(self):
+        if self.store is not None:
+            return self.store.condition(self.row)
+        if self.shared is not None:
+            return self.shared.lists()[1]
+        return self._condition
+
+    @condition.setter
+    def condition(self, condition):
+        if self.store is not None:
+            raise Exception('condition of a classifier in the population is read-only!')
+        self.unshare()
+        self._condition = condition
+
+    def share(self, condition):
+        """ Takes a RuleCondition as the classifier's condition, without copying it. """
+        self.shared = condition
+        self.__dict__.pop('_specified_atts', None)
+        self.__dict__.pop('_condition', None)
+
+    def unshare(self):
+        """ Copy-on-write: gives the classifier its own condition lists before one of them is replaced. """
+        if self.shared is not None:
+            self._specified_atts, self._condition = self.shared.lists()
+            self.shared = None
+
+    def bind(self, store, row):
+        """ Turns the classifier into a view of row in the population store. """
+        self.store = store
+        self.row = row
+        self.shared = None
+        for name in ['_specified_atts', '_condition'] + ['_' + name for name in COLUMNS]:
+            self.__dict__.pop(name, None)
+
+    def unbind(self):
+        """ Copies the classifier's row back into the object and detaches it from the store. """
+        store, row = self.store, self.row
+        self.store = None
+        self.row = None
+        self.specified_atts = store.specified_atts(row)
+        self.condition = store.condition(row)
+        for name in COLUMNS:
+            setattr(self, name, COLUMNS[name](getattr(store, name)[row]).item())
+
+    def classifier_cover(self, set_size, it, condition, target):
+        """ Covering classifier for target with a condition drawn by cover_bounds, as a RuleCondition. """
         self.init_time = it
         self.ave_matchset_size = set_size
         self.prediction = target
-        og = True
-        while og:
-            for ref, x in enumerate(state):
-                if random_func.random() < (1 - PROB_HASH):
-                    self.specified_atts.append(ref)
-                    self.condition.append(build_match(x, attribute_info[ref], dtypes[ref], random_func))
-                    og = False
+        self.share(condition)
         self.label_based = {k: 0.0 for k in self.prediction}
 
     def classifier_copy(self, classifier_old, it):
-        self.specified_atts = deepcopy(classifier_old.specified_atts)
-        self.condition = deepcopy(classifier_old.condition)
-        self.prediction = deepcopy(classifier_old.prediction)
-        self.parent_prediction = deepcopy(classifier_old.parent_prediction)
+        if classifier_old.store is not None:
+            self.share(classifier_old.store.shared_condition(classifier_old.row))
+        elif classifier_old.shared is not None:
+            self.share(classifier_old.shared)
+        else:
+            self.specified_atts = deepcopy(classifier_old.specified_atts)
+            self.condition = deepcopy(classifier_old.condition)
+        self.prediction = classifier_old.prediction
+        self.parent_prediction = list(classifier_old.parent_prediction)
         self.ave_matchset_size = classifier_old.ave_matchset_size
         self.init_time = it
         self.ga_time = it
@@ -81,9 +198,9 @@ class Classifier:
                 update_cond(ref, att_val)
 
         try:
-            self.prediction = set(int(n) for n in classifier_info[dtypes.__len__() + 1].split(";"))
+            self.prediction = LabelSet(int(n) for n in classifier_info[dtypes.__len__() + 1].split(";"))
         except AttributeError:
-            self.prediction.add(classifier_info[dtypes.__len__() + 1])
+            self.prediction = LabelSet([classifier_info[dtypes.__len__() + 1]])
         label_precisions = classifier_info[dtypes.__len__() + 2]
         self.label_based = {int(kv.split("%")[0]): float(kv.split("%")[1]) for kv in label_precisions.split(";")}
         self.fitness, self.loss, self.numerosity, self.match_count, self.ave_matchset_size, self.init_time, \
@@ -97,39 +214,9 @@ class Classifier:
     def update_ga_time(self, time):
         self.ga_time = time
 
-    def update_params(self, m_size, target):
-        #  update_experience()
-        self.match_count += 1
-
-        # update_matchset_size(m_size)
-        if self.match_count < 1.0 / BETA:
-            self.ave_matchset_size += (m_size - self.ave_matchset_size) / float(self.match_count)
-        else:
-            self.ave_matchset_size += BETA * (m_size - self.ave_matchset_size)
-
-        # update_loss(target)
-        if not self.prediction.issubset(target):
-            self.loss += (self.prediction.symmetric_difference(target).__len__() / NO_LABELS)
-
-        # update f-score(target)
-        # self.fscore += (2 * self.prediction.intersection(target).__len__() /
-        #                 (self.prediction.__len__() + target.__len__()))
-
-        # update_fitness()
-        self.fitness = max((1 - self.loss / self.match_count) ** NU, INIT_FITNESS)
-        # self.fitness = max(((accuracy_sum + self.fscore/self.match_count) / 2) ** NU, INIT_FITNESS)
-
     def set_fitness(self, fitness):
         self.fitness = fitness
 
-    def estimate_label_based(self, target_labels):
-        try:
-            for k in self.prediction:
-                count = [1 for labels in target_labels if k in labels]
-                self.label_based[k] = sum(count)/target_labels.__len__()
-        except ZeroDivisionError:
-            pass
-
 
 if __name__ == "__main__":
     # classifier = Classifier(1, 0, [0.5, 0.5], {1, 2})
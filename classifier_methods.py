@@ -11,20 +11,17 @@ class ClassifierMethods:
     def __init__(self, dtypes):
         self.dtypes = dtypes
 
-    def get_deletion_vote(self, classifier, ave_fitness):
-        if classifier.fitness >= ave_fitness * DELTA * classifier.numerosity or classifier.match_count < THETA_DEL:
-            classifier.deletion_vote = classifier.ave_matchset_size * classifier.numerosity
-        else:
-            classifier.deletion_vote = classifier.ave_matchset_size * classifier.numerosity ** 2 * ave_fitness / \
-                                       classifier.fitness
-        return classifier.deletion_vote
-
     def is_equal(self, classifier1, classifier2):
-        if classifier1.prediction == classifier2.prediction and \
-                len(classifier1.specified_atts) == len(classifier2.specified_atts):
-            if sorted(classifier1.specified_atts) == sorted(classifier2.specified_atts):
-                for idx in range(classifier1.specified_atts.__len__()):
-                    if classifier1.condition[idx] == classifier2.condition[idx]:
+        if classifier1.prediction != classifier2.prediction:
+            return False
+        atts1 = classifier1.specified_atts
+        atts2 = classifier2.specified_atts
+        if len(atts1) == len(atts2):
+            if sorted(atts1) == sorted(atts2):
+                condition1 = classifier1.condition
+                condition2 = classifier2.condition
+                for idx in range(atts1.__len__()):
+                    if condition1[idx] == condition2[idx]:
                         pass
                     else:
                         return False
@@ -53,29 +50,33 @@ class ClassifierMethods:
         for ref in cl1_attributes:
             if ref not in cl2_attributes:
                 return False
+            condition1 = classifier1.condition[cl1_attributes.index(ref)]
+            condition2 = classifier2.condition[cl2_attributes.index(ref)]
             if self.dtypes[ref] == 1:
-                if classifier1.condition[cl1_attributes.index(ref)][0] < \
-                        classifier2.condition[cl2_attributes.index(ref)][0]:
+                if condition1[0] > condition2[0]:
                     return False
-                if classifier1.condition[cl1_attributes.index(ref)][1] > \
-                        classifier2.condition[cl2_attributes.index(ref)][1]:
+                if condition1[1] < condition2[1]:
                     return False
+            elif condition1 != condition2:
+                return False
         return True
 
     def classifier_print(self, classifier):
         classifier_string = ""
+        specified_atts = classifier.specified_atts
+        condition = classifier.condition
         for ref in range(self.dtypes.__len__()):
-            if ref in classifier.specified_atts:
-                ind = classifier.specified_atts.index(ref)
+            if ref in specified_atts:
+                ind = specified_atts.index(ref)
                 if self.dtypes[ref] == 1:
-                    classifier_string += (str("%.4f" % classifier.condition[ind][0]) + ';'
-                                          + str("%.4f" % classifier.condition[ind][1]))
+                    classifier_string += (str("%.4f" % condition[ind][0]) + ';'
+                                          + str("%.4f" % condition[ind][1]))
                 else:
-                    classifier_string += str(classifier.condition[ind])
+                    classifier_string += str(condition[ind])
             else:
                 classifier_string += "#"
             classifier_string += ","
-        classifier_string += str("%.4f" % float(classifier.specified_atts.__len__()/self.dtypes.__len__())) + ","
+        classifier_string += str("%.4f" % float(specified_atts.__len__()/self.dtypes.__len__())) + ","
         prediction_string = ";".join([str(label) for label in classifier.prediction])
         classifier_string += (prediction_string + ",")
         label_precision = ";".join([str(label) + '%' + str(round(pr, 4)) for label, pr in classifier.label_based.items()])
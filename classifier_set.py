@@ -4,16 +4,24 @@
 # snazmi@aggies.ncat.edu.
 #
 # ------------------------------------------------------------------------------
+from copy import copy
 from math import sqrt
-from copy import deepcopy
 
+import numpy as np
+from scipy.sparse import csr_matrix
 from sklearn.metrics.pairwise import cosine_similarity
 from scipy.spatial.distance import chebyshev, mahalanobis
+from scipy.linalg import cholesky, LinAlgError
 
 from classifier_methods import ClassifierMethods
-from classifier import Classifier, build_match
+from classifier import Classifier, cover_bounds
 from graph_partitioning import GraphPart
-from prediction import aggregate_prediction, one_threshold
+from label_set import LabelIndex
+from match_engine import VectorMatcher, BitsetIndex, MatchCache, SampleIndex
+from population_store import PopulationStore, RuleCondition, classifier_bounds, unpack_labels
+from subsumption import SubsumptionIndex
+from sum_tree import DeletionVotes
+from prediction import one_threshold, aggregate_votes, max_predictions
 from config import *
 
 
@@ -58,18 +66,10 @@ def distance(classifier, state, cov_inv=None):
     return d_mah
 
 
-def coverage(classifier, data, dtypes):
-    covered_samples = []
-    for sample in data:
-        if match(classifier, sample[0], dtypes):
-            covered_samples.append(sample)
-    # ds = [distance(classifier, sample[0]) for sample in covered_samples]
-    # d_sorted_index = sorted(range(ds.__len__()), key=lambda x: ds[x])
-    # knn_samples = [data[idx] for idx in d_sorted_index[:50]]
-    return covered_samples
-
-
-def ga_coverage(classifier, data, dtypes):
+def ga_coverage(classifier, data, dtypes, index=None):
+    if index:
+        lower, upper = classifier_bounds(dtypes, classifier)
+        return index.any_within(lower, upper)
     for sample in data:
         if match(classifier, sample[0], dtypes):
             return True
@@ -77,11 +77,14 @@ def ga_coverage(classifier, data, dtypes):
 
 
 class ClassifierSets(ClassifierMethods, GraphPart):
-    def __init__(self, attribute_info, dtypes, rand_func, sim_delta, sim_mode='global', clustering_method=None,
-                 cosine_matrix=None, popset=None, data_cov_inv=None):
+    def __init__(self, attribute_info, dtypes, rng, sim_delta, sim_mode='global', clustering_method=None,
+                 cosine_matrix=None, popset=None, data_cov_inv=None, match_engine=MATCH_ENGINE):
         ClassifierMethods.__init__(self, dtypes)
         GraphPart.__init__(self, sim_delta)
-        self.popset = []
+        self.store = PopulationStore(dtypes)
+        self.deletion_votes = DeletionVotes(self.store)
+        self.subsumption = SubsumptionIndex(self.store)
+        self.label_index = LabelIndex(self.store)
         self.matchset = []
         self.correctset = []
         self.micro_pop_size = 0
@@ -90,12 +93,29 @@ class ClassifierSets(ClassifierMethods, GraphPart):
         self.classifier = Classifier()
         self.attribute_info = attribute_info
         self.dtypes = dtypes
-        self.random = rand_func
+        self.rng = rng
+        self.continuous = np.array(dtypes, dtype=bool)
+        self.att_low = np.array([info[0] if dtype else 0.0 for info, dtype in zip(attribute_info, dtypes)])
+        self.att_high = np.array([info[1] if dtype else 0.0 for info, dtype in zip(attribute_info, dtypes)])
         self.cosine_matrix = cosine_matrix
         self.k = MAX_CLASSIFIER
 
+        if match_engine not in [1, 2, 3]:
+            raise Exception('undefined match engine!')
+        self.match_engine = match_engine
+        if match_engine == 2:
+            self.matcher = VectorMatcher(self.store)
+        elif match_engine == 3:
+            self.matcher = BitsetIndex(self.store, attribute_info, INDEX_BINS)
+        else:
+            self.matcher = None
+
+        self.match_cache = MatchCache(self.store, MATCH_CACHE_SIZE) if MATCH_CACHE_SIZE > 0 else None
+        self.sample_index = None
+        self.indexed_data = None
+
         if popset:
-            self.popset = popset
+            self.reset_pop(popset)
 
         if sim_mode == 'global' and not cosine_matrix.any():
             raise Exception('similarity matrix required when sim_mode==Global!')
@@ -114,19 +134,45 @@ class ClassifierSets(ClassifierMethods, GraphPart):
             self.clustering_method = 0
         if data_cov_inv.any():
             self.cov_inv = data_cov_inv
+            try:
+                self.cov_factor = cholesky(data_cov_inv, lower=True)
+            except LinAlgError:
+                self.cov_factor = None
+
+    @property
+    def popset(self):
+        return self.store
+
+    def reset_pop(self, popset):
+        self.store.reset(popset)
+        self.subsumption.reset()
+        self.label_index.reset()
+        if self.matcher:
+            self.matcher.reset()
+        if self.match_cache:
+            self.match_cache.clear()
+
+    def get_matching(self, state, sample_id=None):
+        if self.match_cache and sample_id is not None:
+            matchset = self.match_cache.get(sample_id)
+            if matchset is not None:
+                return matchset
+        if self.matcher:
+            matchset = self.matcher.match(state)
+        else:
+            matchset = [ref for (ref, classifier) in self.popset.items() if match(classifier, state, self.dtypes)]
+        if self.match_cache and sample_id is not None:
+            self.match_cache.put(sample_id, state, matchset)
+        return matchset
 
-    def make_matchset(self, state, target, it):
+    def make_matchset(self, state, target, it, sample_id=None):
         covering = True
-        self.matchset = [ind for (ind, classifier) in enumerate(self.popset) if
-                         match(classifier, state, self.dtypes)]
+        self.matchset = self.get_matching(state, sample_id)
         if self.matchset.__len__() > self.k:
-            d = [distance(self.popset[idx], state, self.cov_inv) for idx in self.matchset]
-            sorted_index = sorted(range(d.__len__()), key=lambda x: d[x])
-            self.matchset = sorted([self.matchset[idx] for idx in sorted_index[:self.k]])
+            self.matchset = sorted(self.closest(self.matchset, state))
 
         if self.matchset.__len__() > 0:
-            lbls = set.union(*[self.popset[idx].prediction for idx in self.matchset])
-            if target.issubset(lbls):
+            if self.label_index.covers(target, self.matchset):
                 covering = False
         # for ind in self.matchset:
         #     if self.popset[ind].prediction == target:
@@ -135,46 +181,101 @@ class ClassifierSets(ClassifierMethods, GraphPart):
 
         if covering:
             numerosity_sum = sum([self.popset[idx].numerosity for idx in self.matchset])
-            new_classifier = Classifier()
-            new_classifier.classifier_cover(numerosity_sum + 1, it, state, target,
-                                            self.attribute_info, self.dtypes, self.random)
+            new_classifier = self.cover(state, [target], numerosity_sum + 1, it)[0]
             new_classifiers, pop_reduce = self.apply_partitioning(it, [new_classifier])
             if new_classifiers.__len__() > 0:
-                for cl in new_classifiers:
-                    new_classifier = Classifier()
-                    new_classifier.classifier_cover(numerosity_sum + 1, it, state, cl.prediction,
-                                                    self.attribute_info, self.dtypes, self.random)
-                    self.insert_classifier_pop(new_classifier, True)
-                    self.matchset.append(self.popset.__len__() - 1)
+                targets = [cl.prediction for cl in new_classifiers]
+                for new_classifier in self.cover(state, targets, numerosity_sum + 1, it):
+                    self.add_to_matchset(self.insert_classifier_pop(new_classifier, True))
             else:
-                self.insert_classifier_pop(new_classifier, True)
-                self.matchset.append(self.popset.__len__() - 1)
+                self.add_to_matchset(self.insert_classifier_pop(new_classifier, True))
         else:
             matching_cls = [self.popset[idx] for idx in self.matchset]
             new_classifiers, pop_reduce = self.apply_partitioning(it, matching_cls)
             if new_classifiers.__len__() > 0:
-                [self.insert_classifier_pop(classifier, True) for classifier in new_classifiers]
-                self.matchset += [self.popset.__len__() - 1 - i for i in range(new_classifiers.__len__())]
-                remove_idx = [idx for idx in self.matchset if self.popset[idx].numerosity == 0]
-                i = 0
-                for idx in remove_idx:
-                    self.remove_from_pop(idx - i)
-                    self.remove_from_matchset(idx - i)
-                    i += 1
+                [self.add_to_matchset(self.insert_classifier_pop(classifier, True)) for classifier in new_classifiers]
+                remove_ids = [ref for ref in self.matchset if self.popset[ref].numerosity == 0]
+                for ref in remove_ids:
+                    self.remove_from_pop(ref)
+                    self.remove_from_matchset(ref)
                 self.micro_pop_size -= pop_reduce
 
-    def make_eval_matchset(self, state):
-        self.matchset = [ind for (ind, classifier) in enumerate(self.popset) if
-                         match(classifier, state, self.dtypes)]
-
-        if self.matchset.__len__() > self.k:
-            d = [distance(self.popset[idx], state, self.cov_inv) for idx in self.matchset]
-            sorted_index = sorted(range(d.__len__()), key=lambda x: d[x])
-            self.matchset = [self.matchset[idx] for idx in sorted_index[:self.k]]
+    def cover(self, state, targets, set_size, it):
+        """ Covering classifiers for state, one per label set in targets, with all conditions drawn at once. """
+        bounds = cover_bounds(state, targets.__len__(), self.att_low, self.att_high, self.continuous, self.rng.cover)
+        classifiers = []
+        for target, lower, upper, specified in zip(targets, *bounds):
+            classifier = Classifier()
+            classifier.classifier_cover(set_size, it, RuleCondition(self.dtypes, lower, upper, specified), target)
+            classifiers.append(classifier)
+        return classifiers
+
+    def closest(self, matchset, state):
+        d = self.store.distance(matchset, state, self.cov_factor, self.cov_inv)
+        kth = np.partition(d, self.k - 1)[self.k - 1]
+        below = np.flatnonzero(d < kth)
+        ties = np.flatnonzero(d == kth)[:self.k - below.__len__()]
+        selected = np.concatenate([below, ties])
+        selected = selected[np.argsort(d[selected], kind='stable')]
+        return [matchset[idx] for idx in selected]
+
+    def make_eval_matchsets(self, states):
+        """
+        Matches a whole batch of states against the population at once.
+        Returns a sparse samples x rules matrix with the top-k cut applied per row; the stored value
+        is the 1-based position of the rule in the sample's matchset, so distance order is preserved.
+        """
+        if self.matcher:
+            rows, cols = self.matcher.match_batch(states)
+            indptr = np.searchsorted(rows, np.arange(states.__len__() + 1))
+            matchsets = [cols[indptr[i]:indptr[i + 1]].tolist() for i in range(states.__len__())]
+        else:
+            matchsets = [self.get_matching(state) for state in states]
+
+        indptr = [0]
+        indices = []
+        data = []
+        for state, matchset in zip(states, matchsets):
+            if matchset.__len__() > self.k:
+                matchset = self.closest(matchset, state)
+            indices += matchset
+            data += range(1, matchset.__len__() + 1)
+            indptr.append(indices.__len__())
+        return csr_matrix((np.array(data, dtype=np.int32), np.array(indices, dtype=np.int32), np.array(indptr)),
+                          shape=(states.__len__(), self.store.size))
+
+    def load_eval_matchset(self, match_matrix, row):
+        start, end = match_matrix.indptr[row], match_matrix.indptr[row + 1]
+        order = np.argsort(match_matrix.data[start:end], kind='stable')
+        self.matchset = match_matrix.indices[start:end][order].tolist()
+
+    def eval_votes(self, match_matrix):
+        """ aggregate_votes over the population for a match matrix from make_eval_matchsets. """
+        size = self.store.size
+        return aggregate_votes(match_matrix, self.store.precision[:size], unpack_labels(self.store.labels[:size]))
+
+    def eval_max_predictions(self, match_matrix, randint_func):
+        """ max_predictions over the population for a match matrix from make_eval_matchsets. """
+        size = self.store.size
+        return max_predictions(match_matrix, self.store.labels[:size], self.store.fitness[:size],
+                               self.store.numerosity[:size], randint_func)
+
+    def frozen(self):
+        """
+        Copy of the population set for make_eval_matchsets and eval_max_predictions only, over a snapshot
+        of the store (PopulationStore.snapshot), so it keeps answering for this point of training.
+        """
+        frozen = copy(self)
+        frozen.store = self.store.snapshot()
+        frozen.matcher = VectorMatcher(frozen.store)
+        frozen.match_cache = None
+        frozen.matchset = []
+        frozen.correctset = []
+        return frozen
 
     def make_correctset(self, target):
         # self.correctset = [ind for ind in self.matchset if self.popset[ind].prediction == target]
-        self.correctset = [ind for ind in self.matchset if self.popset[ind].prediction.issubset(target)]
+        self.correctset = self.label_index.correct(target, self.matchset)
 
     def apply_partitioning(self, it, matching_cls, vote=None):
         if self.sim_mode == 1:
@@ -193,38 +294,40 @@ class ClassifierSets(ClassifierMethods, GraphPart):
 
 # deletion methods
     def deletion(self):
-        while self.micro_pop_size > MAX_CLASSIFIER:
-            self.delete_from_sets()
-
-    def delete_from_sets(self):
-        ave_fitness = sum([classifier.fitness * classifier.numerosity for classifier in self.popset])\
-                       / float(self.micro_pop_size)
-        deletion_vote = ClassifierMethods.get_deletion_vote
-        vote_list = [deletion_vote(self, cl, ave_fitness) for cl in self.popset]
-        vote_sum = sum(vote_list)
-        choice_point = vote_sum * self.random.random()
-
-        new_vote_sum = 0.0
-        for idx in range(vote_list.__len__()):
-            new_vote_sum += vote_list[idx]
-            if new_vote_sum > choice_point:
-                cl = self.popset[idx]
-                cl.update_numerosity(-1)
-                self.micro_pop_size -= 1
-                if cl.numerosity < 1:
-                    self.remove_from_pop(idx)
-                    self.remove_from_matchset(idx)
-                    self.remove_from_correctset(idx)
-                return
+        if self.micro_pop_size > MAX_CLASSIFIER:
+            self.delete_from_sets(self.micro_pop_size - MAX_CLASSIFIER)
+
+    def delete_from_sets(self, count=1):
+        """
+        Removes count micro-classifiers by roulette over the deletion votes in one pass.
+        """
+        stats = self.store.stats
+        self.deletion_votes.sync(stats.total('fitness_numerosity') / float(self.micro_pop_size))
+        for _ in range(count):
+            ave_fitness = stats.total('fitness_numerosity') / float(self.micro_pop_size)
+            choice_point = self.deletion_votes.total(ave_fitness) * self.rng.deletion.random()
+            idx = self.deletion_votes.sample(choice_point, ave_fitness)
+            cl = self.popset[idx]
+            cl.update_numerosity(-1)
+            self.micro_pop_size -= 1
+            if cl.numerosity < 1:
+                self.remove_from_pop(idx)
+                self.remove_from_matchset(idx)
+                self.remove_from_correctset(idx)
+            self.deletion_votes.refresh([idx], stats.total('fitness_numerosity') / float(self.micro_pop_size))
 
     def remove_from_pop(self, ref):
-        self.popset.pop(ref)
+        self.store.remove(ref)
+        self.subsumption.remove(ref)
+        self.label_index.remove(ref)
+        if self.matcher:
+            self.matcher.remove(ref)
+        if self.match_cache:
+            self.match_cache.remove_rule(ref)
 
     def remove_from_matchset(self, ref):
         try:
             self.matchset.remove(ref)
-            matchset_copy = [ind-1 if ind > ref else ind for ind in self.matchset]
-            self.matchset = matchset_copy
         except ValueError:
             pass
 
@@ -233,8 +336,10 @@ class ClassifierSets(ClassifierMethods, GraphPart):
             self.correctset.remove(ref)
         except ValueError:
             pass
-        correctset_copy = [ind - 1 if ind > ref else ind for ind in self.correctset]
-        self.correctset = correctset_copy
+
+    def add_to_matchset(self, ref):
+        if ref not in self.matchset:
+            self.matchset.append(ref)
 
 # genetic algorithm methods
     def apply_ga(self, iteration, state, data):
@@ -242,10 +347,9 @@ class ClassifierSets(ClassifierMethods, GraphPart):
 
         if self.correctset.__len__() > 1:
             parent1, parent2, offspring1, offspring2 = self.selection(iteration)
-            if self.random.random() < P_XOVER and not ClassifierMethods.is_equal(self, offspring1, offspring2):
-                offspring1, offspring2, changed0 = self.xover(offspring1, offspring2)
-            offspring1.condition, offspring1.specified_atts, changed1 = self.mutate(offspring1, state)
-            offspring2.condition, offspring2.specified_atts, changed2 = self.mutate(offspring2, state)
+            bounds1, bounds2 = offspring1.shared.bounds, offspring2.shared.bounds
+            if self.rng.crossover.random() < P_XOVER and not ClassifierMethods.is_equal(self, offspring1, offspring2):
+                bounds1, bounds2, changed0 = self.xover(bounds1, bounds2)
         else:
             parent1 = self.popset[self.correctset[0]]
             parent2 = parent1
@@ -253,9 +357,12 @@ class ClassifierSets(ClassifierMethods, GraphPart):
             offspring1.classifier_copy(parent1, iteration)
             offspring2 = Classifier()
             offspring2.classifier_copy(parent2, iteration)
+            bounds1, bounds2 = offspring1.shared.bounds, offspring2.shared.bounds
 
-            offspring1.condition, offspring1.specified_atts, changed1 = self.mutate(offspring1, state)
-            offspring2.condition, offspring2.specified_atts, changed2 = self.mutate(offspring2, state)
+        for offspring, bounds in [(offspring1, bounds1), (offspring2, bounds2)]:
+            bounds = self.mutate(bounds, state)
+            if bounds is not offspring.shared.bounds:
+                offspring.share(RuleCondition(self.dtypes, *bounds))
 
         if changed0:
             offspring1.set_fitness(FITNESS_RED * (offspring1.fitness + offspring2.fitness)/2)
@@ -264,9 +371,10 @@ class ClassifierSets(ClassifierMethods, GraphPart):
             offspring1.set_fitness(FITNESS_RED * offspring1.fitness)
             offspring2.set_fitness(FITNESS_RED * offspring2.fitness)
 
-        if ga_coverage(offspring1, data, self.dtypes):
+        index = self.index_samples(data)
+        if ga_coverage(offspring1, data, self.dtypes, index):
             self.insert_discovered_classifier(offspring1, parent1, parent2)
-        if ga_coverage(offspring2, data, self.dtypes):
+        if ga_coverage(offspring2, data, self.dtypes, index):
             self.insert_discovered_classifier(offspring2, parent1, parent2)
 
     def selection(self, iteration):
@@ -297,7 +405,7 @@ class ClassifierSets(ClassifierMethods, GraphPart):
         i = 0
         w, v = fitness[0], self.correctset[0]
         while n:
-            x = total * (1 - self.random.random() ** (1.0 / self.correctset.__len__()))
+            x = total * (1 - self.rng.selection.random() ** (1.0 / self.correctset.__len__()))
             total -= x
             while x > w:
                 x -= w
@@ -309,121 +417,106 @@ class ClassifierSets(ClassifierMethods, GraphPart):
 
     def tournament(self, candidates, tsize=5):
         for i in range(candidates.__len__()):
-            candidates = self.random.sample(candidates, min(candidates.__len__(), tsize))
+            candidates = self.rng.selection.sample(candidates, min(candidates.__len__(), tsize))
             return max(candidates, key=lambda x: x.fitness)
 
-    def xover(self, offspring1, offspring2):
-        changed = False
-        atts_child1 = offspring1.specified_atts
-        atts_child2 = offspring2.specified_atts
-        cond_child1 = offspring1.condition
-        cond_child2 = offspring2.condition
-
-        def swap1(att0):
-            cond_child2.append(cond_child1.pop(atts_child1.index(att0)))
-            atts_child2.append(att0)
-            atts_child1.remove(att0)
-            return True
-
-        def swap2(att0):
-            cond_child1.append(cond_child2.pop(atts_child2.index(att0)))
-            atts_child1.append(att0)
-            atts_child2.remove(att0)
-            return True
-
-        def swap3(att0):
-            idx1 = atts_child1.index(att0)
-            idx2 = atts_child2.index(att0)
-            if self.dtypes[att0]:  # Continuous attribute
-                choice_key = self.random.randint(0, 3)
-                if choice_key == 0:  # swap min of the range
-                    cond_child1[idx1][0], cond_child2[idx2][0] = cond_child2[idx2][0], cond_child1[idx1][0]
-                elif choice_key == 1:  # swap max of the range
-                    cond_child1[idx1][1], cond_child2[idx2][1] = cond_child2[idx2][1], cond_child1[idx1][1]
-                elif choice_key == 2:  # absorb ranges into child 1
-                    cond_child1[idx1] = [min(cond_child1[idx1][0], cond_child2[idx2][0]),
-                                         max(cond_child1[idx1][1], cond_child2[idx2][1])]
-                    cond_child2.pop(idx2)
-                    atts_child2.remove(att0)
-                else:  # absorb ranges into child 2
-                    cond_child2[idx2] = [min(cond_child1[idx1][0], cond_child2[idx2][0]),
-                                         max(cond_child1[idx1][1], cond_child2[idx2][1])]
-                    cond_child1.pop(idx1)
-                    atts_child1.remove(att0)
-            else:  # Discrete attribute
-                cond_child1[idx1], cond_child2[idx2] = cond_child2[idx2], cond_child1[idx1]
-            return True
-
-        changed = [swap1(att) for att in set(atts_child1).difference(set(atts_child2)) if self.random.random() < 0.5]
-        changed = [swap2(att) for att in set(atts_child2).difference(set(atts_child1)) if self.random.random() < 0.5]
-        changed = [swap3(att) for att in set(atts_child1).intersection(set(atts_child2)) if self.random.random() < 0.5]
-
-        offspring1.condition = cond_child1
-        offspring1.specified_atts = atts_child1
-        offspring2.condition = cond_child2
-        offspring2.specified_atts = atts_child2
-
-        return [offspring1, offspring2, changed]
-
-    def mutate(self, child_classifier, state):
-        og = True
-        changed = False
-        atts_child = []
-        cond_child = []
-
-        while og:
-            atts_child = deepcopy(child_classifier.specified_atts)
-            cond_child = deepcopy(child_classifier.condition)
-
-            def mutate_single(idx):
-                if idx in atts_child:  # attribute specified in classifier condition
-                    if self.random.random() < PROB_HASH:  # remove the specification
-                        ref_2_cond = atts_child.index(idx)
-                        atts_child.remove(idx)
-                        cond_child.pop(ref_2_cond)
-                        return True
-                    elif self.dtypes[idx]:  # continuous attribute
-                        mutate_range = self.random.random() * float(self.attribute_info[idx][1] -
-                                                                    self.attribute_info[idx][0]) / 2
-                        if self.random.random() < 0.5:  # mutate min of the range
-                            if self.random.random() < 0.5:  # add
-                                cond_child[atts_child.index(idx)][0] += mutate_range
-                            else:  # subtract
-                                cond_child[atts_child.index(idx)][0] -= mutate_range
-                                cond_child[atts_child.index(idx)][0] = max(cond_child[atts_child.index(idx)][0],
-                                                                           self.attribute_info[idx][0])
-                        else:  # mutate max of the range
-                            if self.random.random() < 0.5:  # add
-                                cond_child[atts_child.index(idx)][1] += mutate_range
-                                cond_child[atts_child.index(idx)][1] = min(cond_child[atts_child.index(idx)][1],
-                                                                           self.attribute_info[idx][1])
-                            else:  # subtract
-                                cond_child[atts_child.index(idx)][1] -= mutate_range
-                        cond_child[atts_child.index(idx)].sort()
-                        return True
-                    else:
-                        pass
-                else:  # attribute not specified in classifier condition
-                    if self.random.random() < (1 - PROB_HASH):
-                        atts_child.append(idx)
-                        cond_child.append(build_match(state[idx], self.attribute_info[idx],
-                                                                      self.dtypes[idx], self.random))
-                        return True
-                    return False
-
-            changed = [mutate_single(att_idx) for att_idx in range(self.attribute_info.__len__())
-                       if self.random.random() < P_MUT]
-            if atts_child.__len__() > 0:
-                og = False
-        return [cond_child, atts_child, changed]
+    def xover(self, bounds1, bounds2):
+        """
+        Crossover of two (lower, upper, specified) conditions. Each attribute specified only in child 1 moves
+        to child 2 with probability 0.5; each attribute then specified only in child 2, including those just
+        moved, moves to child 1 with probability 0.5. Each attribute specified in both takes part with
+        probability 0.5: continuous ranges swap their min or max or are merged into one child (the other
+        generalizes), and discrete values are swapped. Only the last step counts as a change.
+        """
+        lower1, upper1, specified1 = [array.copy() for array in bounds1]
+        lower2, upper2, specified2 = [array.copy() for array in bounds2]
+        points1, points2, points3 = self.rng.crossover.random((3, self.dtypes.__len__())) < 0.5
+        choice = self.rng.crossover.integers(0, 4, self.dtypes.__len__())
+
+        moved = points1 & specified1 & ~specified2
+        to1 = points2 & ((specified2 & ~specified1) | moved)  # back to child 1 if just moved from it
+        to2 = moved & ~to1
+        to1 &= ~moved
+        both = points3 & specified1 & specified2
+        swap_min = both & (~self.continuous | (choice == 0))
+        swap_max = both & (~self.continuous | (choice == 1))
+        into1 = both & self.continuous & (choice == 2)
+        into2 = both & self.continuous & (choice == 3)
+
+        lower1[swap_min], lower2[swap_min] = lower2[swap_min], lower1[swap_min]
+        upper1[swap_max], upper2[swap_max] = upper2[swap_max], upper1[swap_max]
+        merged_lower, merged_upper = np.minimum(lower1, lower2), np.maximum(upper1, upper2)
+        lower1[into1], upper1[into1] = merged_lower[into1], merged_upper[into1]
+        lower2[into2], upper2[into2] = merged_lower[into2], merged_upper[into2]
+        lower1[to1], upper1[to1] = lower2[to1], upper2[to1]
+        lower2[to2], upper2[to2] = lower1[to2], upper1[to2]
+
+        drop1, drop2 = to2 | into2, to1 | into1
+        lower1[drop1], upper1[drop1] = -np.inf, np.inf
+        lower2[drop2], upper2[drop2] = -np.inf, np.inf
+        specified1 = (specified1 | to1) & ~drop1
+        specified2 = (specified2 | to2) & ~drop2
+        return [(lower1, upper1, specified1), (lower2, upper2, specified2), bool(both.any())]
+
+    def mutate(self, bounds, state):
+        """
+        Mutation of a (lower, upper, specified) condition. Mutation points come from one Bernoulli(P_MUT)
+        draw over the attributes: a specified attribute is generalized with probability PROB_HASH, otherwise
+        a continuous range moves its min or max by up to half the attribute range; an unspecified attribute
+        is specialized around the state with probability 1 - PROB_HASH. Attempts leaving no attribute
+        specified are redrawn, in blocks, and only the points of the kept attempt touch copies of the arrays;
+        without any point the input bounds are returned as they are.
+        """
+        specified0 = bounds[2]
+        tries = 1 if specified0.any() else 64
+        while True:
+            points, hashed = self.rng.mutation.random((2, tries, self.dtypes.__len__()))
+            points = points < P_MUT
+            generalize = points & specified0 & (hashed < PROB_HASH)
+            specialize = points & ~specified0 & (hashed < (1 - PROB_HASH))
+            valid = np.flatnonzero(((specified0 & ~generalize) | specialize).any(axis=1))
+            if valid.__len__() > 0:
+                break
+        t = valid[0]
+        if not points[t].any():
+            return bounds
+        lower, upper, specified = [array.copy() for array in bounds]
+        for att in np.flatnonzero(points[t]).tolist():
+            low, high = self.att_low[att], self.att_high[att]
+            if generalize[t, att]:  # remove the specification
+                lower[att], upper[att], specified[att] = -np.inf, np.inf, False
+            elif specified[att] and self.dtypes[att]:  # continuous attribute
+                step, move_min, add = self.rng.mutation.random(3)
+                step *= (high - low) / 2
+                if move_min < 0.5:
+                    lower[att] = lower[att] + step if add < 0.5 else max(lower[att] - step, low)
+                else:
+                    upper[att] = min(upper[att] + step, high) if add < 0.5 else upper[att] - step
+                lower[att], upper[att] = min(lower[att], upper[att]), max(lower[att], upper[att])
+            elif specialize[t, att]:  # specify around the state
+                if self.dtypes[att]:
+                    radius_l, radius_r = self.rng.mutation.integers(25, 76, 2) * 0.01 * (high - low) / 2
+                    lower[att], upper[att] = max(low, state[att] - radius_l), min(high, state[att] + radius_r)
+                else:
+                    lower[att] = upper[att] = state[att]
+                specified[att] = True
+        return lower, upper, specified
 
     def insert_classifier_pop(self, classifier, search_matchset=False):
         existing_classifier = self.get_identical(classifier, search_matchset)
         if isinstance(existing_classifier, Classifier):
             existing_classifier.update_numerosity(1)
-        else:
-            self.popset.append(classifier)
+            self.micro_pop_size += 1
+            return existing_classifier.row
+        row = self.store.add(classifier)
+        self.subsumption.add(row)
+        self.label_index.add(row)
+        if self.matcher:
+            self.matcher.add(row)
+        if self.match_cache:
+            self.match_cache.add_rule(row)
         self.micro_pop_size += 1
+        return row
 
     def insert_discovered_classifier(self, offspring, parent1, parent2):
         if DO_SUBSUMPTION:
@@ -433,22 +526,16 @@ class ClassifierSets(ClassifierMethods, GraphPart):
             self.insert_classifier_pop(offspring)
 
     def get_identical(self, classifier, search_matchset=False):
+        identical = self.store.find(classifier)
         if search_matchset:
-            identical = [self.popset[ref] for ref in self.matchset if
-                         ClassifierMethods.is_equal(self, classifier, self.popset[ref])]
-            if identical:
-                return identical[0]
-        else:
-            identical = [cl for cl in self.popset if
-                         ClassifierMethods.is_equal(self, classifier, cl)]
-            if identical:
-                return identical[0]
+            identical = [ref for ref in self.matchset if ref in identical]
+        if identical:
+            return self.popset[identical[0] if search_matchset else min(identical)]
         return None
 
     def get_time_average(self):
-        numerosity_sum = sum([self.popset[idx].numerosity for idx in self.correctset])
-        time_sum = sum([(self.popset[idx].ga_time * self.popset[idx].numerosity) for idx in self.correctset])
-        return time_sum / float(numerosity_sum)
+        numerosity = self.store.numerosity[self.correctset]
+        return float((self.store.ga_time[self.correctset] * numerosity).sum() / float(numerosity.sum()))
 
 # subsumption methods
     def subsume_into_parents(self, offspring, parent1, parent2):
@@ -462,10 +549,12 @@ class ClassifierSets(ClassifierMethods, GraphPart):
             self.subsume_into_correctset(offspring)
 
     def subsume_into_correctset(self, classifier):
-        choices = [ref for ref in self.correctset if
-                   ClassifierMethods.subsumption(self, self.popset[ref], classifier)]
+        group = self.subsumption.group(classifier.prediction)
+        candidates = [ref for ref in self.correctset if ref in group and
+                      ClassifierMethods.is_subsumer(self, self.popset[ref])]
+        choices = self.subsumption.more_general_than(classifier, candidates) if candidates else []
         if choices:
-            idx = self.random.randint(0, choices.__len__()-1)
+            idx = self.rng.subsumption.randint(0, choices.__len__()-1)
             self.popset[choices[idx]].update_numerosity(1)
             self.micro_pop_size += 1
             return
@@ -474,35 +563,56 @@ class ClassifierSets(ClassifierMethods, GraphPart):
     def subsume_correctset(self):
         if self.correctset.__len__() > 1:
             subsumer = None
-            compare_list = self.correctset.copy()
             for ref in self.correctset:
                 if ClassifierMethods.is_subsumer(self, self.popset[ref]):
-                    subsumer = self.popset[ref]
-                    compare_list = compare_list.remove(ref)
+                    subsumer = ref
                     break
-
-            if subsumer and compare_list:
-                delete_list = [ref for ref in compare_list if
-                               ClassifierMethods.is_more_general(self, subsumer, self.popset[ref])]
-                sub = 0
-                for ref in delete_list:
-                    ref -= sub
-                    subsumer.update_numerosity(self.popset[ref].numerosity)
+            if subsumer is None:
+                return
+            group = self.subsumption.group(self.popset[subsumer].prediction)
+            compare_list = [ref for ref in self.correctset if ref != subsumer and ref in group]
+            if compare_list:
+                for ref in self.subsumption.more_general(subsumer, compare_list):
+                    self.popset[subsumer].update_numerosity(self.popset[ref].numerosity)
                     self.remove_from_pop(ref)
                     self.remove_from_matchset(ref)
                     self.remove_from_correctset(ref)
-                    sub += 1
-            else:
-                return
+
+    def subsumption_sweep(self):
+        """ Population-wide subsumption within each label set, most general subsumers first. """
+        for group in [sorted(group) for group in self.subsumption.groups.values() if group.__len__() > 1]:
+            subsumers = [ref for ref in group if ClassifierMethods.is_subsumer(self, self.popset[ref])]
+            subsumers.sort(key=lambda ref: self.store.specified[ref].sum())
+            alive = set(group)
+            for subsumer in subsumers:
+                if subsumer not in alive:
+                    continue
+                others = [ref for ref in group if ref in alive and ref != subsumer]
+                for ref in self.subsumption.more_general(subsumer, others):
+                    self.popset[subsumer].update_numerosity(self.popset[ref].numerosity)
+                    self.remove_from_pop(ref)
+                    alive.discard(ref)
 
 # update sets
     def update_sets(self, target):
-        m_size = sum([self.popset[ref].numerosity for ref in self.matchset])
-        [self.popset[ref].update_params(m_size, target) for ref in self.matchset]
+        m_size = int(self.store.numerosity[self.matchset].sum())
+        self.store.update_params(self.matchset, m_size, target)
+
+    def index_samples(self, data):
+        if self.indexed_data is not data or self.sample_index.size != data.__len__():
+            self.sample_index = SampleIndex([sample[0] for sample in data], self.dtypes.__len__())
+            self.indexed_data = data
+        return self.sample_index
 
     def estimate_label_pr(self, data):
-        for cl in self.popset:
-            cl.estimate_label_based([sample[1] for sample in coverage(cl, data, self.dtypes)])
+        indicators = np.zeros((data.__len__(), NO_LABELS))
+        for idx, sample in enumerate(data):
+            indicators[idx, list(sample[1])] = 1.0
+        covered, counts = self.store.coverage_counts([sample[0] for sample in data], indicators)
+        for row, cl in self.popset.items():
+            if covered[row] > 0:
+                cl.label_based.update({k: float(counts[row, k] / covered[row]) for k in cl.prediction})
+                self.store.write_precision(row, cl.label_based)
 
     def clear_sets(self):
         self.matchset = []
@@ -510,18 +620,31 @@ class ClassifierSets(ClassifierMethods, GraphPart):
 
 # evaluation methods
     def pop_average_eval(self, no_features):
-        generality_sum = sum([(no_features - classifier.specified_atts.__len__())/float(no_features)
-                              for classifier in self.popset])
-        fitness_sum = sum([classifier.fitness for classifier in self.popset])
+        stats = self.store.stats
+        if stats.check and stats.total('numerosity') != self.micro_pop_size:
+            raise Exception('micro population size is %d, the rules add up to %d!'
+                            % (self.micro_pop_size, stats.total('numerosity')))
         try:
-            self.ave_generality = generality_sum / float(self.popset.__len__())
-            self.ave_fitness = fitness_sum / float(self.popset.__len__())
+            self.ave_generality = 1 - stats.total('specified') / float(no_features * self.popset.__len__())
+            self.ave_fitness = stats.total('fitness') / float(self.popset.__len__())
         except ZeroDivisionError:
             self.ave_generality = None
             self.ave_fitness = None
 
+    def compact_ids(self):
+        """ Renumbers the rule ids once too many of them are free; call between iterations. """
+        if self.store.fragmentation() <= ID_COMPACTION:
+            return
+        order = self.store.compact()
+        self.subsumption.reset()
+        self.label_index.reset()
+        if self.matcher:
+            self.matcher.reset()
+        if self.match_cache:
+            self.match_cache.remap(order)
+
     def pop_compaction(self):
-        self.popset = [classifier for classifier in self.popset if classifier.match_count > 0]
+        self.reset_pop([classifier for classifier in self.popset if classifier.match_count > 0])
 
 # other methods
     def get_pop_tracking(self):
@@ -6,6 +6,7 @@
 # ------------------------------------------------------------------------------
 
 SEED_NUMBER = 10
+RANDOM_BLOCK = 1024  # uniforms each random stream pre-draws at a time for scalar draws
 
 DATA_DIR = "D:\Datasets"
 DATA_HEADER = "pascal-voc6"
@@ -19,12 +20,21 @@ MAX_ITERATION = 5000
 MAX_CLASSIFIER = 3000
 PROB_HASH = 0.9
 TRACK_FREQ = 1000
+TRACK_ASYNC = False  # score tracking checkpoints on a frozen population in a background thread while training goes on
+TRACK_SAMPLES = 0  # samples per set scored at a tracking checkpoint, stratified by label set (0: all)
 AVG_COUNT = 10
 
+MATCH_ENGINE = 2  # 1: per-rule matching - 2: vectorized matching over the whole population - 3: attribute bitset index
+INDEX_BINS = 16  # bins per continuous attribute when MATCH_ENGINE == 3
+MATCH_CACHE_SIZE = 5000  # max training samples with a cached matchset (0: no cache)
+ID_COMPACTION = 0.25  # renumber rule ids once this share of the population rows is free
+CHECK_AGGREGATES = False  # debug: compare the running population totals against a full recompute on every read
 PREDICTION_METHOD = 2  # 1: max prediction - 2: aggregated prediction
 THRESHOLD = 1  # 1: score-based one-threshold - 2: rank-based rank-cut
 THETA = 0.5
 RANK_CUT = 1
+EVAL_CHUNK = 0  # samples scored at a time in evaluation (0: all at once); chunked runs two passes with binned votes
+SCORE_BINS = 1000  # vote ranges per label in chunked evaluation, exact up to that many distinct votes per label
 
 K = 2  # number of label clusters
 L_MIN = 2
@@ -42,6 +52,7 @@ ERROR = 1e-2
 DELTA = 0.1
 THETA_DEL = 20
 DO_SUBSUMPTION = False
+SUBSUMPTION_SWEEP = 0  # population-wide subsumption every this many iterations (0: never)
 
 # GA parameters
 SELECTION = 't'   # 'r': roulette wheel selection - 't': tournament selection
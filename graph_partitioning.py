@@ -12,6 +12,7 @@ from sklearn.cluster import SpectralClustering
 
 from hfps_clustering import density_based
 from classifier import Classifier
+from label_set import LabelSet
 from config import *
 
 
@@ -71,8 +72,8 @@ class GraphPart:
     def build_sim_graph(self, matching_classifiers, cosine_matrix=None):
         self.label_matrix = []
         if any([classifier.prediction.__len__() > 1 for classifier in matching_classifiers]):
-            self.predicted_labels = sorted(list(set().union(*[classifier.prediction for classifier
-                                                              in matching_classifiers])))
+            self.predicted_labels = list(LabelSet().union(*[classifier.prediction for classifier
+                                                            in matching_classifiers]))
 
             def label_vector(classifier):
                 return [max(classifier.label_based[label] / classifier.match_count, INIT_FITNESS)
@@ -102,7 +103,7 @@ class GraphPart:
 
         if n_connected > 1:
             for c in range(n_connected):
-                self.label_clusters.append(set([self.predicted_labels[node] for node in
+                self.label_clusters.append(LabelSet([self.predicted_labels[node] for node in
                                                 range(self.predicted_labels.__len__()) if label_connected[node] == c]))
         else:
             if clustering_method == 1:
@@ -118,7 +119,7 @@ class GraphPart:
                                         assign_labels='discretize', weights=vertex_weights)
                 sc.fit_predict(self.label_similarity)
                 for n in range(K):
-                    self.label_clusters.append(set([self.predicted_labels[idx] for idx in range(self.predicted_labels.__len__())
+                    self.label_clusters.append(LabelSet([self.predicted_labels[idx] for idx in range(self.predicted_labels.__len__())
                                                if sc.labels_[idx] == n]))
             else:
                 pass
@@ -0,0 +1,167 @@
+# Shabnam Nazmi.
+# Graduate research assistant at electrical and computer engineering department,
+# North Carolina A&T State University, Greensboro, NC.
+# snazmi@aggies.ncat.edu.
+#
+# ------------------------------------------------------------------------------
+from config import *
+from match_engine import rule_bits
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # python < 3.10
+    def popcount(mask):
+        return bin(mask).count('1')
+
+
+def as_mask(labels):
+    """ Bitmask of a label set given as a LabelSet, an int mask or any iterable of labels. """
+    if isinstance(labels, int):
+        return labels
+    mask = 0
+    for label in labels:
+        mask |= 1 << int(label)
+    return mask
+
+
+class LabelSet(int):
+    """
+    Immutable label set kept as an integer bitmask, bit l standing for label l. Python integers are not
+    bounded to a machine word, so above 64 labels the same mask simply spans several words. It offers the
+    read-only part of the set interface, with intersection, union, difference and symmetric difference as
+    AND, OR, AND NOT and XOR and the size as a popcount; being an int, it hashes and compares by mask, and
+    the &, | and ^ operators give the plain int mask for hot loops that only count bits.
+    An int argument is taken as the mask itself, any other iterable as the labels.
+    """
+    __slots__ = ()
+
+    def __new__(cls, labels=()):
+        if type(labels) is cls:
+            return labels
+        return int.__new__(cls, as_mask(labels))
+
+    @classmethod
+    def full(cls, n_labels):
+        return int.__new__(cls, (1 << n_labels) - 1)
+
+    __len__ = popcount
+
+    def __iter__(self):
+        mask = int(self)
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    def __contains__(self, label):
+        label = int(label)
+        return label >= 0 and (int(self) >> label) & 1 == 1
+
+    def intersection(self, *others):
+        mask = int(self)
+        for other in others:
+            mask &= as_mask(other)
+        return int.__new__(LabelSet, mask)
+
+    def union(self, *others):
+        mask = int(self)
+        for other in others:
+            mask |= as_mask(other)
+        return int.__new__(LabelSet, mask)
+
+    def difference(self, *others):
+        mask = int(self)
+        for other in others:
+            mask &= ~as_mask(other)
+        return int.__new__(LabelSet, mask)
+
+    def symmetric_difference(self, other):
+        return int.__new__(LabelSet, self ^ as_mask(other))
+
+    def issubset(self, other):
+        return not self & ~as_mask(other)
+
+    def issuperset(self, other):
+        return not as_mask(other) & ~self
+
+    def isdisjoint(self, other):
+        return not self & as_mask(other)
+
+    def complement(self, n_labels):
+        return LabelSet.full(n_labels).difference(self)
+
+    def __repr__(self):
+        return 'LabelSet(%s)' % list(self)
+
+    __str__ = __repr__
+
+
+class LabelIndex:
+    """
+    Inverted index from each label, and from each distinct label set, to the rule ids predicting it, kept
+    as bitsets over the rule ids like in BitsetIndex. It follows the population's insert and remove events,
+    so covering and correct set questions about a match set become a few AND/OR over its bitset instead of
+    a pass over the rules' predictions.
+    """
+    def __init__(self, store, n_labels=NO_LABELS):
+        self.store = store
+        self.n_labels = n_labels
+        self.labels = [0] * n_labels
+        self.powersets = {}
+        self.keys = {}
+
+    def add(self, row):
+        bit = 1 << row
+        key = LabelSet(self.store[row].prediction)
+        for label in key:
+            self.labels[label] |= bit
+        self.powersets[key] = self.powersets.get(key, 0) | bit
+        self.keys[row] = key
+
+    def remove(self, ref):
+        keep = ~(1 << ref)
+        key = self.keys.pop(ref)
+        for label in key:
+            self.labels[label] &= keep
+        self.powersets[key] &= keep
+        if not self.powersets[key]:
+            del self.powersets[key]
+
+    def reset(self):
+        self.labels = [0] * self.n_labels
+        self.powersets = {}
+        self.keys = {}
+        [self.add(row) for row, _ in self.store.items()]
+
+    def covers(self, target, refs):
+        """ Whether the rules in refs predict every label of target between them. """
+        bits = rule_bits(refs)
+        if self.powersets.get(target, 0) & bits:
+            return True
+        return all(self.labels[label] & bits for label in target)
+
+    def correct(self, target, refs):
+        """
+        The rules in refs whose prediction is a subset of target, in the order of refs. Takes the cheapest of
+        the label sets inside target, the distinct label sets of the population or the labels outside target.
+        """
+        bits = rule_bits(refs)
+        outside = target.complement(self.n_labels)
+        subsets = (1 << target.__len__()) - 1
+        if subsets <= min(self.powersets.__len__(), outside.__len__()):
+            correct = 0
+            subset = int(target)
+            while subset:
+                correct |= self.powersets.get(subset, 0)
+                subset = (subset - 1) & target
+            bits &= correct
+        elif self.powersets.__len__() < outside.__len__():
+            correct = 0
+            for key, rules in self.powersets.items():
+                if key.issubset(target):
+                    correct |= rules
+            bits &= correct
+        else:
+            for label in outside:
+                bits &= ~self.labels[label]
+        return [ref for ref in refs if bits >> ref & 1]
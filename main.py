@@ -7,7 +7,6 @@
 from os.path import join
 from os import makedirs
 from joblib import Parallel, delayed
-import random
 import time
 from collections import Counter
 
@@ -27,7 +26,6 @@ def handle_model(args):
 
 
 def run_parallel(olo, cv, cmplt):
-    random.seed(SEED_NUMBER)
     makedirs(REPORT_PATH, exist_ok=True)
     makedirs(join(REPORT_PATH, DATA_HEADER), exist_ok=True)
 
@@ -0,0 +1,325 @@
+# Shabnam Nazmi.
+# Graduate research assistant at electrical and computer engineering department,
+# North Carolina A&T State University, Greensboro, NC.
+# snazmi@aggies.ncat.edu.
+#
+# ------------------------------------------------------------------------------
+from collections import OrderedDict
+
+import numpy as np
+
+BATCH_CELLS = 2 ** 24  # upper bound on the samples x rules x features comparisons held in memory at once
+
+
+class VectorMatcher:
+    """
+    Matches states against the dense population bounds in the PopulationStore (row i is rule id i).
+    Unspecified attributes are stored as (-inf, inf) and discrete attributes as (value, value),
+    so matching a state is a single broadcast comparison over all rules; free rows match nothing.
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def add(self, row):
+        pass
+
+    def remove(self, ref):
+        pass
+
+    def reset(self):
+        pass
+
+    def match_vector(self, state):
+        x = np.asarray(state, dtype=float)
+        lower = self.store.lower[:self.store.size]
+        upper = self.store.upper[:self.store.size]
+        return ((lower <= x) & (x <= upper)).all(axis=1)
+
+    def match(self, state):
+        return np.flatnonzero(self.match_vector(state)).tolist()
+
+    def match_batch(self, states):
+        """ Returns (sample, rule) coordinates of all matches, row-major, for a samples x features matrix. """
+        x = np.asarray(states, dtype=float)
+        size = self.store.size
+        lower = self.store.lower[:size]
+        upper = self.store.upper[:size]
+        chunk = max(1, BATCH_CELLS // max(1, size * self.store.no_features))
+        rows, cols = [], []
+        for start in range(0, x.shape[0], chunk):
+            x_chunk = x[start:start + chunk, None, :]
+            matched = ((lower <= x_chunk) & (x_chunk <= upper)).all(axis=2)
+            r, c = np.nonzero(matched)
+            rows.append(r + start)
+            cols.append(c)
+        if not rows:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        return np.concatenate(rows), np.concatenate(cols)
+
+
+def bit_positions(bits):
+    if not bits:
+        return []
+    raw = np.frombuffer(bits.to_bytes((bits.bit_length() + 7) // 8, 'little'), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(raw, bitorder='little')).tolist()
+
+
+def rule_bits(refs):
+    """ Bitset with bit i set for every rule id i in refs, the inverse of bit_positions. """
+    bits = 0
+    for ref in refs:
+        bits |= 1 << ref
+    return bits
+
+
+class BitsetIndex(VectorMatcher):
+    """
+    Quantized attribute index over the population, bit i of every bitset stands for rule id i.
+    Each continuous attribute range is split into equal-width bins; for every (attribute, bin) it keeps
+    the rules whose interval covers the whole bin and the rules whose interval only partly overlaps it.
+    Discrete attributes map each value to the rules requiring it. A state's candidates are the AND over
+    its attributes, and only candidates sitting in a partly covered bin get an exact check.
+    """
+    def __init__(self, store, attribute_info, bins=16):
+        VectorMatcher.__init__(self, store)
+        self.dtypes = store.dtypes
+        self.no_features = store.no_features
+        self.bins = bins
+        self.continuous = np.array(self.dtypes, dtype=bool)
+        self.edges = np.zeros((self.no_features, bins + 1))
+        for att in range(self.no_features):
+            if self.dtypes[att]:
+                self.edges[att] = np.linspace(attribute_info[att][0], attribute_info[att][1], bins + 1)
+        self.size = 0
+        self.clear_bits()
+
+    def clear_bits(self):
+        self.all_bits = 0
+        self.unspecified = [0] * self.no_features
+        self.full = [[0] * self.bins if dtype else None for dtype in self.dtypes]
+        self.boundary = [[0] * self.bins if dtype else None for dtype in self.dtypes]
+        self.values = [None if dtype else {} for dtype in self.dtypes]
+        self.entries = {}  # rule id -> (unspecified attributes, full bins, boundary bins, discrete values) it is in
+
+    def locate(self, x):
+        """ Bin of each attribute value such that edges[b] <= x <= edges[b + 1], -1 when out of range. """
+        low, high = self.edges[:, 0], self.edges[:, -1]
+        width = (high - low) / self.bins
+        with np.errstate(divide='ignore', invalid='ignore'):
+            b = np.where(width > 0, np.floor((x - low) / width), 0)
+        b = np.clip(np.nan_to_num(b), 0, self.bins - 1).astype(int)
+        rows = np.arange(self.no_features)
+        b -= (b > 0) & (x < self.edges[rows, b])
+        b += (b < self.bins - 1) & (x >= self.edges[rows, b + 1])
+        b[(x < low) | (x > high)] = -1
+        return b
+
+    def add(self, row):
+        bit = 1 << row
+        self.size += 1
+        self.all_bits |= bit
+        lower, upper, specified = self.store.lower[row], self.store.upper[row], self.store.specified[row]
+        continuous = specified & self.continuous
+        full = (lower[:, None] <= self.edges[:, :-1]) & (self.edges[:, 1:] <= upper[:, None]) & continuous[:, None]
+        overlap = (self.edges[:, :-1] <= upper[:, None]) & (lower[:, None] <= self.edges[:, 1:]) & continuous[:, None]
+        unspecified = np.flatnonzero(~specified).tolist()
+        full_bins = list(zip(*np.nonzero(full)))
+        boundary_bins = list(zip(*np.nonzero(overlap & ~full)))
+        values = [(att, lower[att]) for att in np.flatnonzero(specified & ~self.continuous)]
+        for att in unspecified:
+            self.unspecified[att] |= bit
+        for att, b in full_bins:
+            self.full[att][b] |= bit
+        for att, b in boundary_bins:
+            self.boundary[att][b] |= bit
+        for att, value in values:
+            self.values[att][value] = self.values[att].get(value, 0) | bit
+        self.entries[row] = (unspecified, full_bins, boundary_bins, values)
+
+    def remove(self, ref):
+        """ Clears the rule's bit in the entries it was added to only. """
+        keep = ~(1 << ref)
+        self.size -= 1
+        self.all_bits &= keep
+        unspecified, full_bins, boundary_bins, values = self.entries.pop(ref)
+        for att in unspecified:
+            self.unspecified[att] &= keep
+        for att, b in full_bins:
+            self.full[att][b] &= keep
+        for att, b in boundary_bins:
+            self.boundary[att][b] &= keep
+        for att, value in values:
+            bits = self.values[att][value] & keep
+            if bits:
+                self.values[att][value] = bits
+            else:
+                del self.values[att][value]
+
+    def reset(self):
+        self.clear_bits()
+        self.size = 0
+        [self.add(row) for row, _ in self.store.items()]
+
+    def candidates(self, x):
+        candidates = self.all_bits
+        check = 0
+        bins = self.locate(x)
+        for att in range(self.no_features):
+            if self.dtypes[att]:
+                b = bins[att]
+                if b < 0:
+                    check |= self.all_bits ^ self.unspecified[att]
+                    continue
+                candidates &= self.unspecified[att] | self.full[att][b] | self.boundary[att][b]
+                check |= self.boundary[att][b]
+            else:
+                candidates &= self.unspecified[att] | self.values[att].get(x[att], 0)
+            if not candidates:
+                return 0, 0
+        return candidates & ~check, candidates & check
+
+    def match(self, state):
+        x = np.asarray(state, dtype=float)
+        sure, check = self.candidates(x)
+        matchset = bit_positions(sure)
+        check = bit_positions(check)
+        if check:
+            lower, upper = self.store.lower[check], self.store.upper[check]
+            passed = ((lower <= x) & (x <= upper)).all(axis=1)
+            matchset = sorted(matchset + [ref for ref, ok in zip(check, passed) if ok])
+        return matchset
+
+
+class MatchCache:
+    """
+    Raw (pre top-k) matchsets of recently visited training samples, kept as rows of a samples x rule ids
+    boolean matrix. Rows are updated from the population's insert/remove events and remapped when the
+    rule ids are compacted, so revisiting a sample skips matching. Least recently used samples are
+    evicted once max_samples rows are in use.
+    """
+    def __init__(self, store, max_samples):
+        self.store = store
+        self.max_samples = max_samples
+        self.size = store.size
+        self.slots = OrderedDict()
+        self.states = np.zeros((0, store.no_features))
+        self.matches = np.zeros((0, max(64, store.size)), dtype=bool)
+        self.hits = 0
+        self.misses = 0
+        self.saved_checks = 0
+        self.update_checks = 0
+
+    def clear(self):
+        self.slots.clear()
+        self.size = self.store.size
+        self.matches = np.zeros((self.states.shape[0], max(64, self.size)), dtype=bool)
+
+    def grow(self, sample_capacity, rule_capacity):
+        old_samples, old_rules = self.matches.shape
+        if sample_capacity > old_samples:
+            sample_capacity = min(self.max_samples, max(sample_capacity, 2 * old_samples))
+        else:
+            sample_capacity = old_samples
+        if rule_capacity > old_rules:
+            rule_capacity = max(rule_capacity, 2 * old_rules)
+        else:
+            rule_capacity = old_rules
+        if (sample_capacity, rule_capacity) == (old_samples, old_rules):
+            return
+        matches = np.zeros((sample_capacity, rule_capacity), dtype=bool)
+        matches[:old_samples, :old_rules] = self.matches
+        states = np.zeros((sample_capacity, self.store.no_features))
+        states[:old_samples] = self.states
+        self.matches, self.states = matches, states
+
+    def get(self, key):
+        slot = self.slots.get(key)
+        if slot is None:
+            self.misses += 1
+            return None
+        self.slots.move_to_end(key)
+        self.hits += 1
+        self.saved_checks += self.size
+        return np.flatnonzero(self.matches[slot, :self.size]).tolist()
+
+    def put(self, key, state, matchset):
+        if self.max_samples < 1:
+            return
+        if self.slots.__len__() >= self.max_samples:
+            _, slot = self.slots.popitem(last=False)
+        else:
+            slot = self.slots.__len__()
+            self.grow(slot + 1, self.size)
+        self.states[slot] = state
+        self.matches[slot] = False
+        self.matches[slot, matchset] = True
+        self.slots[key] = slot
+
+    def add_rule(self, row):
+        self.grow(0, row + 1)
+        n = self.slots.__len__()
+        if n > 0:
+            lower, upper = self.store.lower[row], self.store.upper[row]
+            states = self.states[:n]
+            self.matches[:n, row] = ((lower <= states) & (states <= upper)).all(axis=1)
+            self.update_checks += n
+        self.size = max(self.size, row + 1)
+
+    def remove_rule(self, ref):
+        self.matches[:self.slots.__len__(), ref] = False
+
+    def remap(self, order):
+        """ Follows a compaction of the rule ids: new id i is old id order[i]. """
+        n = self.slots.__len__()
+        self.matches[:n, :order.__len__()] = self.matches[:n, order]
+        self.matches[:n, order.__len__():self.size] = False
+        self.size = order.__len__()
+
+    def hit_rate(self):
+        try:
+            return self.hits / float(self.hits + self.misses)
+        except ZeroDivisionError:
+            return 0.0
+
+
+class SampleIndex:
+    """
+    Per-attribute sorted columns over a fixed samples x features matrix, answering which samples fall
+    inside a box of (lower, upper) bounds. Each bounded attribute gives a contiguous slice of its sorted
+    column by binary search; the narrowest slice supplies the candidates, which are then checked against
+    the remaining bounds. An empty slice on any attribute answers without touching the samples.
+    """
+    def __init__(self, states, no_features):
+        self.states = np.asarray(states, dtype=float).reshape(-1, no_features)
+        self.size = self.states.shape[0]
+        self.order = np.argsort(self.states, axis=0, kind='stable')
+        self.sorted = np.take_along_axis(self.states, self.order, axis=0)
+
+    def candidates(self, lower, upper):
+        atts = np.flatnonzero((lower > -np.inf) | (upper < np.inf))
+        best, start, end = None, 0, self.size
+        for att in atts:
+            lo = np.searchsorted(self.sorted[:, att], lower[att], side='left')
+            hi = np.searchsorted(self.sorted[:, att], upper[att], side='right')
+            if hi <= lo:
+                return np.zeros(0, dtype=int), atts
+            if best is None or hi - lo < end - start:
+                best, start, end = att, lo, hi
+        if best is None:
+            return np.arange(self.size), atts
+        return self.order[start:end, best], atts
+
+    def within(self, lower, upper):
+        """ Sorted indices of the samples inside the box. """
+        candidates, atts = self.candidates(lower, upper)
+        x = self.states[candidates][:, atts]
+        inside = ((lower[atts] <= x) & (x <= upper[atts])).all(axis=1)
+        return np.sort(candidates[inside])
+
+    def any_within(self, lower, upper, chunk=256):
+        candidates, atts = self.candidates(lower, upper)
+        for start in range(0, candidates.__len__(), chunk):
+            x = self.states[candidates[start:start + chunk]][:, atts]
+            if ((lower[atts] <= x) & (x <= upper[atts])).all(axis=1).any():
+                return True
+        return False
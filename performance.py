@@ -4,103 +4,59 @@
 # snazmi@aggies.ncat.edu.
 #
 # ------------------------------------------------------------------------------
-import operator
-from sklearn.metrics import roc_curve, auc, coverage_error, label_ranking_average_precision_score
-from numpy import zeros, isnan
+from numpy import zeros, where, inf, arange, divide, errstate, concatenate, diff
 
 from config import *
-
-
-def exact_match(prediction, target):
-    if prediction == target:
-        return 1
-    else:
-        return 0
-
-
-def precision(prediction, target):
-    try:
-        return prediction.intersection(target).__len__() / prediction.__len__()
-    except ZeroDivisionError:
-        return 0.0
-
-
-def recall(prediction, target):
-    try:
-        return prediction.intersection(target).__len__() / target.__len__()
-    except ZeroDivisionError:
-        return 0.0
-
-
-def accuracy(prediction, target):
-    try:
-        return prediction.intersection(target).__len__()/prediction.union(target).__len__()
-    except ZeroDivisionError:
-        return 0.0
+from label_set import LabelSet, popcount
+from match_engine import BATCH_CELLS
+from population_store import label_matrix
 
 
 def fscore(prediction, target):
     try:
-        return 2 * prediction.intersection(target).__len__()\
-                              / (prediction.__len__() + target.__len__())
-    except ZeroDivisionError:
-        return 0.0
-
-
-def hamming_loss(prediction, target, n_labels):
-    return prediction.symmetric_difference(target).__len__() / n_labels
-
-
-def rank_loss(vote, target, n_labels):
-    if not vote:
-        return 1.0
-
-    target_complement = set(range(0, n_labels)).difference(target)
-    loss = 0
-    for tc in target_complement:
-        for t in target:
-            if vote.get(t, 0) < vote.get(tc, -1e-5):
-                loss += 1
-    try:
-        return loss / (target.__len__() * target_complement.__len__())
+        return 2 * popcount(prediction & target) / (popcount(prediction) + popcount(target))
     except ZeroDivisionError:
         return 0.0
 
 
-def one_error(vote, target):
-    try:
-        labels_max_vote = {max(vote.items(), key=operator.itemgetter(1))[0]}
-    except ValueError:
-        labels_max_vote = set()
-    if labels_max_vote.intersection(target).__len__() > 0:
-        return 0
-    else:
-        return 1.0
-
-
-def coverage(vote, target, no_labels):
-    vote0 = zeros(no_labels)
-    target0 = zeros(no_labels)
-    for k, v in vote.items():
-        vote0[k] = v
-    for t in target:
-        target0[t] = 1.0
-    vote0 = vote0.reshape((1, no_labels))
-    target0 = target0.reshape((1, no_labels))
-    return coverage_error(target0, vote0)
-
-
-def rank_precision(vote, target, no_labels):
-    vote0 = zeros(no_labels)
-    target0 = zeros(no_labels)
-    for k, v in vote.items():
-        vote0[k] = v
-    for t in target:
-        target0[t] = 1.0
-    vote0 = vote0.reshape((1, no_labels))
-    target0 = target0.reshape((1, no_labels))
-    rp = label_ranking_average_precision_score(target0, vote0)
-    return rp
+def ranking_measures(votes, voted, targets):
+    """
+    One-error, ranking loss, coverage and ranking average precision of every sample at once, from the
+    samples x labels votes, the mask of labels voted for and the 0/1 targets. A sample without any vote
+    counts as a one-error and a full ranking loss. Works through blocks of at most BATCH_CELLS label pairs.
+    """
+    n_samples, n_labels = votes.shape
+    one_errors, rank_losses = zeros(n_samples), zeros(n_samples)
+    coverages, rank_precisions = zeros(n_samples), zeros(n_samples)
+    step = max(1, BATCH_CELLS // max(1, n_labels * n_labels))
+    for start in range(0, n_samples, step):
+        block = slice(start, start + step)
+        vote, target = where(voted[block], votes[block], 0.0), targets[block].astype(bool)
+        any_vote = voted[block].any(axis=1)
+        n_target = target.sum(axis=1)
+        rows = arange(vote.shape[0])
+
+        best = where(voted[block], votes[block], -inf).argmax(axis=1)
+        one_errors[block] = where(any_vote & target[rows, best], 0.0, 1.0)
+
+        complement = where(voted[block], votes[block], -1e-5)
+        wrong_order = (vote[:, :, None] < complement[:, None, :]) & target[:, :, None] & ~target[:, None, :]
+        loss = wrong_order.sum(axis=(1, 2))
+        pairs = n_target * (n_labels - n_target)
+        with errstate(divide='ignore', invalid='ignore'):
+            rank_losses[block] = where(any_vote, where(pairs > 0, loss / pairs, 0.0), 1.0)
+
+        min_relevant = where(target, vote, inf).min(axis=1)
+        coverages[block] = where(n_target > 0, (vote >= min_relevant[:, None]).sum(axis=1), 0)
+
+        # sklearn's label ranking average precision, ranks counting ties at their highest position
+        above = vote[:, None, :] >= vote[:, :, None]
+        rank = above.sum(axis=2)
+        relevant_rank = (above & target[:, None, :]).sum(axis=2)
+        with errstate(divide='ignore', invalid='ignore'):
+            precision_at = where(target, relevant_rank / rank, 0.0).sum(axis=1) / n_target
+        rank_precisions[block] = where((n_target == 0) | (n_target == n_labels), 1.0, precision_at)
+    return one_errors, rank_losses, coverages, rank_precisions
 
 
 class Performance:
@@ -114,7 +70,9 @@ class Performance:
         self.hamming_loss_example = 0.0
         self.rank_loss_example = 0.0
         self.one_error_example = 0.0
-        self.class_based_measure = [dict(TP=0.0, FP=0.0, TN=0.0, FN=0.0)] * self.n_labels
+        self.tp = zeros(self.n_labels)
+        self.fp = zeros(self.n_labels)
+        self.fn = zeros(self.n_labels)
         self.micro_precision = 0.0
         self.micro_recall = 0.0
         self.micro_fscore = 0.0
@@ -122,39 +80,45 @@ class Performance:
         self.macro_recall = 0.0
         self.macro_fscore = 0.0
         self.roc_auc = 0.0
+        self.roc_auc_error = 0.0  # bound on the roc_auc error when computed from vote histograms
+        self.theta_error = 0.0  # bound on the per-label F-score the thresholds from vote histograms give up
         self.coverage_example = 0.0
         self.rank_precision_example = 0.0
 
-    def update_example_based(self, vote, prediction, target):
-        self.exact_match_example += exact_match(prediction, target)
-        self.hamming_loss_example += hamming_loss(prediction, target, self.n_labels)
-        self.precision_example += precision(prediction, target)
-        self.recall_example += recall(prediction, target)
-        self.fscore_example += fscore(prediction, target)
-        self.accuracy_example += accuracy(prediction, target)
+    def update(self, votes, voted, predictions, targets):
+        """
+        Adds up the example and class based measures of a batch of samples: the samples x labels votes with
+        the mask of labels voted for (see prediction.aggregate_votes), and the 0/1 predictions and targets.
+        """
+        predictions, targets = predictions.astype(bool), targets.astype(bool)
+        n_predicted, n_target = predictions.sum(axis=1), targets.sum(axis=1)
+        n_correct = (predictions & targets).sum(axis=1)
+        n_union = (predictions | targets).sum(axis=1)
+
+        def ratio(a, b):
+            return divide(a, b, out=zeros(a.shape), where=b > 0)
+
+        self.exact_match_example += float((predictions == targets).all(axis=1).sum())
+        self.hamming_loss_example += float((predictions ^ targets).sum(axis=1).sum() / self.n_labels)
+        self.precision_example += float(ratio(n_correct, n_predicted).sum())
+        self.recall_example += float(ratio(n_correct, n_target).sum())
+        self.fscore_example += float(ratio(2 * n_correct, n_predicted + n_target).sum())
+        self.accuracy_example += float(ratio(n_correct, n_union).sum())
         if PREDICTION_METHOD == 2:
-            self.one_error_example += one_error(vote, target)
-            self.rank_loss_example += rank_loss(vote, target, self.n_labels)
-            self.coverage_example += coverage(vote, target, self.n_labels)
-            self.rank_precision_example += rank_precision(vote, target, self.n_labels)
-
-    def update_class_based(self, prediction, target):
-        tp = target.intersection(prediction)
-        fp = prediction.difference(target.intersection(prediction))
-        fn = target.difference(target.intersection(prediction))
-
-        def update_single(label, where):
-            class_dict = self.class_based_measure[label].copy()
-            class_dict[where] += 1
-            self.class_based_measure[label] = class_dict
-        [update_single(label, 'TP') for label in tp]
-        [update_single(label, 'FP') for label in fp]
-        [update_single(label, 'FN') for label in fn]
+            one_errors, rank_losses, coverages, rank_precisions = ranking_measures(votes, voted, targets)
+            self.one_error_example += float(one_errors.sum())
+            self.rank_loss_example += float(rank_losses.sum())
+            self.coverage_example += float(coverages.sum())
+            self.rank_precision_example += float(rank_precisions.sum())
+
+        self.tp += (predictions & targets).sum(axis=0)
+        self.fp += (predictions & ~targets).sum(axis=0)
+        self.fn += (~predictions & targets).sum(axis=0)
 
     def micro_average(self):
-        tp_sum = sum([class_dict['TP'] for class_dict in self.class_based_measure])
-        fp_sum = sum([class_dict['FP'] for class_dict in self.class_based_measure])
-        fn_sum = sum([class_dict['FN'] for class_dict in self.class_based_measure])
+        tp_sum = float(self.tp.sum())
+        fp_sum = float(self.fp.sum())
+        fn_sum = float(self.fn.sum())
         try:
             self.micro_precision = tp_sum / (tp_sum + fp_sum)
         except ZeroDivisionError:
@@ -167,29 +131,21 @@ class Performance:
             / (self.micro_precision + self.micro_recall + 1e-3)
 
     def macro_average(self):
-        self.macro_precision = sum([class_dict['TP'] / (class_dict['TP'] + class_dict['FP'] + 1e-3) for
-                                    class_dict in self.class_based_measure]) / self.n_labels
-        self.macro_recall = sum([class_dict['TP'] / (class_dict['TP'] + class_dict['FN'] + 1e-3) for
-                                class_dict in self.class_based_measure]) / self.n_labels
+        self.macro_precision = float((self.tp / (self.tp + self.fp + 1e-3)).sum() / self.n_labels)
+        self.macro_recall = float((self.tp / (self.tp + self.fn + 1e-3)).sum() / self.n_labels)
         self.macro_fscore = 2 * (self.macro_precision * self.macro_recall) \
             / (self.macro_precision + self.macro_recall + 1e-3)
 
-    def roc(self, votes, targets):
-        vote_list = zeros((votes.__len__(), self.n_labels))
-        target_list = zeros((votes.__len__(), self.n_labels))
-        idx = 0
-        for vote, target in zip(votes, targets):
-            for k, v in vote.items():
-                vote_list[idx][k] = v
-            for t in target:
-                target_list[idx][t] = 1
-            idx += 1
-
+    def roc(self, curves):
+        """ Mean ROC AUC over the labels, from their curves (see prediction.label_curves); 0 without both classes. """
         roc_auc = []
-        for l in range(self.n_labels):
-            fpr, tpr, _ = roc_curve(target_list[:, l], vote_list[:, l])
-            roc_auc.append(auc(fpr, tpr))
-        roc_auc = [0 if isnan(val) else val for val in roc_auc]
+        for _, tps, fps in curves:
+            if tps.__len__() == 0 or tps[-1] <= 0 or fps[-1] <= 0:
+                roc_auc.append(0)
+                continue
+            tpr = concatenate([[0.0], tps / tps[-1]])
+            fpr = concatenate([[0.0], fps / fps[-1]])
+            roc_auc.append(float((diff(fpr) * (tpr[1:] + tpr[:-1]) / 2.0).sum()))
         self.roc_auc = sum(roc_auc) / self.n_labels
 
     def get_report(self, sample_count):
@@ -211,14 +167,17 @@ class Performance:
         multi_label_perf['cov-error'] = self.coverage_example / sample_count
         multi_label_perf['rank-pr'] = self.rank_precision_example / sample_count
         multi_label_perf['roc-auc'] = self.roc_auc
+        if EVAL_CHUNK:
+            multi_label_perf['roc-auc-error'] = self.roc_auc_error
+            multi_label_perf['theta-f-error'] = self.theta_error
         return multi_label_perf
 
 # extended hamming loss
 
 
 if __name__ == "__main__":
-    measure = Performance(5)
-    prediction0 = {1, 2}
-    target0 = {2, 4}
-    measure.update_class_based(prediction0, target0)
+    measure = Performance()
+    prediction0 = label_matrix([LabelSet([1, 2])])
+    target0 = label_matrix([LabelSet([2, 4])])
+    measure.update(zeros(prediction0.shape), zeros(prediction0.shape, dtype=bool), prediction0, target0)
     measure.micro_average()
@@ -0,0 +1,458 @@
+# Shabnam Nazmi.
+# Graduate research assistant at electrical and computer engineering department,
+# North Carolina A&T State University, Greensboro, NC.
+# snazmi@aggies.ncat.edu.
+#
+# ------------------------------------------------------------------------------
+import numpy as np
+
+from config import *
+from label_set import LabelSet
+from match_engine import BATCH_CELLS
+
+COLUMNS = {'numerosity': np.int64, 'match_count': np.int64, 'fitness': np.float64, 'loss': np.float64,
+           'ave_matchset_size': np.float64, 'init_time': np.int64, 'ga_time': np.int64}
+LABEL_WORDS = (NO_LABELS + 63) // 64
+
+
+def pack_labels(labels):
+    """ LABEL_WORDS uint64 words of a label set's bitmask, low word first. """
+    mask = int(LabelSet(labels))
+    return np.frombuffer(mask.to_bytes(LABEL_WORDS * 8, 'little'), dtype='<u8').astype(np.uint64)
+
+
+def unpack_label_set(words):
+    """ LabelSet of a packed label set, the inverse of pack_labels. """
+    return LabelSet(int.from_bytes(np.asarray(words, dtype='<u8').tobytes(), 'little'))
+
+
+def label_matrix(label_sets):
+    """ Label sets x NO_LABELS 0/1 indicator matrix. """
+    words = np.zeros((label_sets.__len__(), LABEL_WORDS), dtype=np.uint64)
+    for row, labels in enumerate(label_sets):
+        words[row] = pack_labels(labels)
+    return unpack_labels(words)
+
+
+def count_labels(words):
+    """ Size of each packed label set along the last axis. """
+    return np.unpackbits(np.ascontiguousarray(words).view(np.uint8), axis=-1).sum(axis=-1)
+
+
+def unpack_labels(words):
+    """ 0/1 label indicators of packed label sets along the last axis, NO_LABELS wide. """
+    bits = np.unpackbits(np.ascontiguousarray(words).view(np.uint8), axis=-1, bitorder='little')
+    return bits[..., :NO_LABELS].astype(bool)
+
+
+def condition_bounds(dtypes, specified_atts, condition):
+    """ (lower, upper) arrays of a condition, (-inf, inf) where unspecified and (value, value) if discrete. """
+    lower = np.full(dtypes.__len__(), -np.inf)
+    upper = np.full(dtypes.__len__(), np.inf)
+    for att, cond in zip(specified_atts, condition):
+        if dtypes[att]:
+            lower[att], upper[att] = cond[0], cond[1]
+        else:
+            lower[att] = upper[att] = cond
+    return lower, upper
+
+
+def bounds_condition(dtypes, lower, upper, specified):
+    """ (specified_atts, condition) lists of a rule given as bound arrays and a specified mask. """
+    atts = np.flatnonzero(specified).tolist()
+    return atts, [[float(lower[att]), float(upper[att])] if dtypes[att] else float(lower[att]) for att in atts]
+
+
+def rule_signature(dtypes, specified_atts, condition, prediction):
+    """ Canonical, hashable form of a rule: its prediction and its bounds in attribute order. """
+    bounds = [(att, float(cond[0]), float(cond[1])) if dtypes[att] else (att, float(cond), float(cond))
+              for att, cond in zip(specified_atts, condition)]
+    return LabelSet(prediction), tuple(sorted(bounds))
+
+
+def bounds_key(lower, upper, specified):
+    """ Condition part of rule_signature, from bound arrays. """
+    return tuple((att, float(lower[att]), float(upper[att])) for att in np.flatnonzero(specified).tolist())
+
+
+class RuleCondition:
+    """
+    Immutable condition, read-only (lower, upper, specified) arrays shared by every classifier copied from
+    the same rule. Nothing copies it until a GA operator writes, and those work on copies of the arrays;
+    the list form is derived on each access, like for classifiers bound to the store.
+    """
+    def __init__(self, dtypes, lower, upper, specified):
+        self.dtypes = dtypes
+        self.bounds = (lower, upper, specified)
+        for array in self.bounds:
+            array.setflags(write=False)
+        self.key = None
+
+    def lists(self):
+        return bounds_condition(self.dtypes, *self.bounds)
+
+    def signature(self, prediction):
+        if self.key is None:
+            self.key = bounds_key(*self.bounds)
+        return LabelSet(prediction), self.key
+
+
+def classifier_bounds(dtypes, classifier):
+    """ (lower, upper) arrays of a classifier's condition, shared or not. """
+    if classifier.shared is not None:
+        return classifier.shared.bounds[:2]
+    return condition_bounds(dtypes, classifier.specified_atts, classifier.condition)
+
+
+class PopulationStats:
+    """
+    Running totals over the live rules of a store: numerosity, fitness, fitness x numerosity and specified
+    attributes. The store takes a row's share out before it writes one of their inputs and adds it back
+    after, so reading a total is O(1). With check set, every read is compared against a full recompute.
+    """
+    def __init__(self, store, check=CHECK_AGGREGATES):
+        self.store = store
+        self.check = check
+        self.numerosity = 0
+        self.fitness = 0.0
+        self.fitness_numerosity = 0.0
+        self.specified = 0
+
+    def shares(self, rows):
+        store = self.store
+        numerosity, fitness = store.numerosity[rows], store.fitness[rows]
+        return [int(numerosity.sum()), float(fitness.sum()), float((fitness * numerosity).sum()),
+                int(store.specified[rows].sum())]
+
+    def add(self, rows, sign=1):
+        numerosity, fitness, fitness_numerosity, specified = self.shares(rows)
+        self.numerosity += sign * numerosity
+        self.fitness += sign * fitness
+        self.fitness_numerosity += sign * fitness_numerosity
+        self.specified += sign * specified
+
+    def subtract(self, rows):
+        self.add(rows, -1)
+
+    def change(self, row, numerosity, fitness):
+        """ Row's numerosity and fitness are about to change from their stored values to these. """
+        old_numerosity, old_fitness = int(self.store.numerosity[row]), float(self.store.fitness[row])
+        self.numerosity += numerosity - old_numerosity
+        self.fitness += fitness - old_fitness
+        self.fitness_numerosity += fitness * numerosity - old_fitness * old_numerosity
+
+    def rebuild(self):
+        self.numerosity, self.fitness, self.fitness_numerosity, self.specified = self.shares(slice(0, self.store.size))
+
+    def total(self, name):
+        value = getattr(self, name)
+        if self.check:
+            fresh = self.shares(slice(0, self.store.size))[['numerosity', 'fitness', 'fitness_numerosity',
+                                                             'specified'].index(name)]
+            if not np.isclose(value, fresh, rtol=1e-9, atol=1e-9):
+                raise Exception('population total of %s is %r, a full recompute gives %r!' % (name, value, fresh))
+        return value
+
+
+class PopulationStore:
+    """
+    Columnar storage of the population. Each rule gets a stable id, its row in the store, for as long as it
+    stays in the population: removed rows are tombstoned (bounds that match nothing, zero numerosity) and
+    their ids reused through a free list, so removals never shift other rules. size counts the rows in
+    use including free ones; len() and iteration only see live rules, in id order.
+    Bounds keep unspecified attributes as (-inf, inf) and discrete ones as (value, value), scalar
+    parameters are one array each and predictions are packed into a rules x LABEL_WORDS bit matrix, next to
+    precision, the rules x labels matrix of each rule's label_based values (0 for labels it has none for).
+    Classifiers in rules are views reading and writing their row (see classifier.Classifier); since their
+    condition and prediction don't change while stored, signatures maps each rule_signature to the ids
+    holding it, for O(1) duplicate lookups, and conditions caches the RuleCondition handed out for a row
+    to the classifiers copied from it. Rows whose
+    deletion vote inputs were written since the last sync are kept in dirty, and reordered is set once
+    ids have been reassigned (see sum_tree.DeletionVotes). stats keeps the population totals (PopulationStats).
+    """
+    def __init__(self, dtypes, capacity=MAX_CLASSIFIER + 64):
+        self.dtypes = dtypes
+        self.no_features = dtypes.__len__()
+        self.size = 0
+        self.capacity = 0
+        self.rules = []
+        self.free = []
+        self.live = 0
+        self.signatures = {}
+        self.conditions = {}
+        self.dirty = set()
+        self.reordered = True
+        self.stats = PopulationStats(self)
+        self.lower = self.upper = self.specified = self.labels = self.precision = None
+        for name in COLUMNS:
+            setattr(self, name, None)
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, 2 * self.capacity)
+        n = self.size
+
+        def extend(old, shape, dtype, fill=0):
+            new = np.full(shape, fill, dtype=dtype)
+            if old is not None:
+                new[:n] = old[:n]
+            return new
+
+        self.lower = extend(self.lower, (capacity, self.no_features), np.float64, -np.inf)
+        self.upper = extend(self.upper, (capacity, self.no_features), np.float64, np.inf)
+        self.specified = extend(self.specified, (capacity, self.no_features), bool, False)
+        self.labels = extend(self.labels, (capacity, LABEL_WORDS), np.uint64)
+        self.precision = extend(self.precision, (capacity, NO_LABELS), np.float64)
+        for name, dtype in COLUMNS.items():
+            setattr(self, name, extend(getattr(self, name), capacity, dtype))
+        self.capacity = capacity
+
+    def __len__(self):
+        return self.live
+
+    def __iter__(self):
+        return (classifier for classifier in self.rules if classifier is not None)
+
+    def __getitem__(self, rule_id):
+        return self.rules[rule_id]
+
+    def items(self):
+        return ((rule_id, classifier) for rule_id, classifier in enumerate(self.rules) if classifier is not None)
+
+    def add(self, classifier):
+        """ Stores the classifier under a free id, or a new one, and turns it into a view of that row. """
+        if self.free:
+            row = self.free.pop()
+            self.rules[row] = classifier
+        else:
+            self.grow(self.size + 1)
+            row = self.size
+            self.rules.append(classifier)
+            self.size += 1
+        if classifier.shared is not None:
+            self.write_bounds(row, *classifier.shared.bounds)
+            self.conditions[row] = classifier.shared
+        else:
+            self.write_bounds(row, *condition_bounds(self.dtypes, classifier.specified_atts, classifier.condition),
+                              classifier.specified_atts)
+        self.labels[row] = pack_labels(classifier.prediction)
+        self.write_precision(row, classifier.label_based)
+        for name in COLUMNS:
+            getattr(self, name)[row] = getattr(classifier, name)
+        self.signatures.setdefault(self.signature(classifier), []).append(row)
+        self.stats.add(row)
+        classifier.bind(self, row)
+        self.live += 1
+        self.dirty.add(row)
+        return row
+
+    def write_bounds(self, row, lower, upper, specified):
+        self.lower[row], self.upper[row] = lower, upper
+        self.specified[row] = False
+        self.specified[row, specified] = True
+
+    def write_precision(self, row, label_based):
+        """ Row of the rules x labels precision matrix from a classifier's label_based dict. """
+        self.precision[row] = 0.0
+        if label_based:
+            self.precision[row, list(label_based.keys())] = list(label_based.values())
+
+    def write(self, name, row, value, tracked=False):
+        """ Writes a parameter of a stored rule, keeping stats and the dirty rows up to date. """
+        if name == 'numerosity':
+            self.stats.change(row, value, float(self.fitness[row]))
+        elif name == 'fitness':
+            self.stats.change(row, int(self.numerosity[row]), value)
+        getattr(self, name)[row] = value
+        if tracked:
+            self.dirty.add(row)
+
+    def clear_rows(self, rows):
+        self.lower[rows] = np.inf
+        self.upper[rows] = -np.inf
+        self.specified[rows] = False
+        self.labels[rows] = 0
+        self.precision[rows] = 0.0
+        for name in COLUMNS:
+            getattr(self, name)[rows] = 0
+
+    def remove(self, ref):
+        """ Frees rule id ref; the removed classifier keeps a detached copy of its data. """
+        classifier = self.rules[ref]
+        signature = self.signature(classifier)
+        self.signatures[signature].remove(ref)
+        if not self.signatures[signature]:
+            del self.signatures[signature]
+        classifier.unbind()
+        self.conditions.pop(ref, None)
+        self.stats.subtract(ref)
+        self.rules[ref] = None
+        self.clear_rows(ref)
+        self.free.append(ref)
+        self.live -= 1
+        self.dirty.add(ref)
+
+    def signature(self, classifier):
+        if classifier.store is self:
+            row = classifier.row
+            return LabelSet(classifier.prediction), bounds_key(self.lower[row], self.upper[row], self.specified[row])
+        if classifier.shared is not None:
+            return classifier.shared.signature(classifier.prediction)
+        return rule_signature(self.dtypes, classifier.specified_atts, classifier.condition, classifier.prediction)
+
+    def find(self, classifier):
+        """ Ids of the rules with the same condition and prediction as classifier, in insertion order. """
+        return self.signatures.get(self.signature(classifier), [])
+
+    def shared_condition(self, row):
+        """ RuleCondition of a stored rule, made once and shared by all the classifiers copied from it. """
+        condition = self.conditions.get(row)
+        if condition is None:
+            condition = self.conditions[row] = RuleCondition(self.dtypes, *self.bounds(row))
+        return condition
+
+    def fragmentation(self):
+        try:
+            return self.free.__len__() / float(self.size)
+        except ZeroDivisionError:
+            return 0.0
+
+    def compact(self):
+        """ Moves the live rules to rows 0..live-1, keeping their order. Returns the old id of each new row. """
+        order = np.array([rule_id for rule_id, _ in self.items()], dtype=int)
+        n = order.__len__()
+        for array in [self.lower, self.upper, self.specified, self.labels, self.precision] + \
+                [getattr(self, name) for name in COLUMNS]:
+            array[:n] = array[order]
+        self.clear_rows(slice(n, self.size))
+        self.rules = [self.rules[rule_id] for rule_id in order]
+        for row, classifier in enumerate(self.rules):
+            classifier.row = row
+        new_id = {rule_id: row for row, rule_id in enumerate(order.tolist())}
+        self.signatures = {signature: [new_id[rule_id] for rule_id in ids]
+                           for signature, ids in self.signatures.items()}
+        self.conditions = {new_id[rule_id]: condition for rule_id, condition in self.conditions.items()}
+        self.size = n
+        self.free = []
+        self.reordered = True
+        self.stats.rebuild()
+        return order
+
+    def snapshot(self):
+        """
+        Frozen copy of the live rules' arrays, moved to rows 0..live-1 in id order, for reading the population
+        while training goes on. It holds no classifiers, so only the array based methods apply to it.
+        """
+        rows = np.array([rule_id for rule_id, _ in self.items()], dtype=int)
+        frozen = PopulationStore(self.dtypes, capacity=0)
+        for name in ['lower', 'upper', 'specified', 'labels', 'precision'] + list(COLUMNS):
+            setattr(frozen, name, getattr(self, name)[rows])
+        frozen.size = frozen.live = frozen.capacity = rows.__len__()
+        frozen.rules = [None] * rows.__len__()
+        frozen.stats.rebuild()
+        return frozen
+
+    def reset(self, popset):
+        for classifier in self:
+            classifier.unbind()
+        self.rules = []
+        self.free = []
+        self.signatures = {}
+        self.conditions = {}
+        self.size = 0
+        self.live = 0
+        self.reordered = True
+        self.stats.rebuild()
+        self.lower[:] = -np.inf
+        self.upper[:] = np.inf
+        self.specified[:] = False
+        self.grow(popset.__len__())
+        for classifier in popset:
+            if classifier.store is not None:
+                classifier.unbind()
+            self.add(classifier)
+
+    def specified_atts(self, row):
+        return np.flatnonzero(self.specified[row]).tolist()
+
+    def condition(self, row):
+        return bounds_condition(self.dtypes, self.lower[row], self.upper[row], self.specified[row])[1]
+
+    def bounds(self, row):
+        """ Copies of the row's (lower, upper, specified) arrays. """
+        return self.lower[row].copy(), self.upper[row].copy(), self.specified[row].copy()
+
+    def update_params(self, rows, m_size, target):
+        """
+        Updates the rules in a match set of m_size micro classifiers after seeing target: one more match, the
+        average match set size as a running mean over the first 1 / BETA matches and a BETA step after, the loss
+        grown by the share of labels the prediction differs from target on unless it is a subset of target, and
+        fitness max((1 - loss / match_count) ** NU, INIT_FITNESS). Predictions are read from the packed labels.
+        """
+        rows = np.asarray(rows, dtype=int)
+        self.stats.subtract(rows)
+        match_count = self.match_count[rows] + 1
+        ave_matchset_size = self.ave_matchset_size[rows]
+        ave_matchset_size += np.where(match_count < 1.0 / BETA, (m_size - ave_matchset_size) / match_count,
+                                      BETA * (m_size - ave_matchset_size))
+        labels = self.labels[rows]
+        target = pack_labels(target)
+        wrong = (labels & ~target).any(axis=1)
+        loss = self.loss[rows]
+        loss[wrong] += count_labels(labels[wrong] ^ target) / NO_LABELS
+        self.match_count[rows] = match_count
+        self.ave_matchset_size[rows] = ave_matchset_size
+        self.loss[rows] = loss
+        accuracy = 1 - loss / match_count
+        if NU != 1:  # numpy's vectorized power can differ from Python's in the last bit
+            accuracy = np.array([value ** NU for value in accuracy.tolist()])
+        self.fitness[rows] = np.maximum(accuracy, INIT_FITNESS)
+        self.stats.add(rows)
+        self.dirty.update(rows.tolist())
+
+    def distance(self, rows, state, cov_factor=None, cov_inv=None):
+        """
+        Mahalanobis distance between the state and each rule center, with unspecified attributes taken
+        from the state, divided by the rule's number of specified attributes (see classifier_set.distance).
+        Centers are the middle of the bounds, worked out for the rows asked for only: a stored center array
+        costs 8 bytes per feature per rule and has to follow every bounds write, for one add and halving.
+        cov_factor is a lower Cholesky factor of cov_inv; without it the full quadratic form is used.
+        """
+        specified = self.specified[rows]
+        with np.errstate(invalid='ignore'):  # (-inf, inf) bounds of unspecified attributes, masked below
+            center = (self.lower[rows] + self.upper[rows]) / 2
+        diff = np.where(specified, center - np.asarray(state, dtype=float), 0.0)
+        if cov_factor is not None:
+            d = np.linalg.norm(diff @ cov_factor, axis=1)
+        else:
+            d = np.sqrt(np.einsum('ij,jk,ik->i', diff, cov_inv, diff))
+        return d / specified.sum(axis=1)
+
+    def coverage_counts(self, states, indicators):
+        """
+        For a samples x features matrix and its samples x labels 0/1 matrix, returns the number of samples
+        each row covers and the rows x labels counts of covered samples carrying each label. Works through
+        blocks of at most BATCH_CELLS comparisons.
+        """
+        x = np.asarray(states, dtype=float)
+        indicators = np.asarray(indicators, dtype=float)
+        covered = np.zeros(self.size)
+        counts = np.zeros((self.size, indicators.shape[1]))
+        samples = max(1, min(x.shape[0], BATCH_CELLS // max(1, self.no_features)))
+        rules = max(1, BATCH_CELLS // (samples * max(1, self.no_features)))
+        for start in range(0, x.shape[0], samples):
+            x_block = x[start:start + samples, None, :]
+            y_block = indicators[start:start + samples]
+            for row in range(0, self.size, rules):
+                end = min(row + rules, self.size)
+                lower, upper = self.lower[row:end], self.upper[row:end]
+                matched = ((lower <= x_block) & (x_block <= upper)).all(axis=2).T.astype(float)
+                covered[row:end] += matched.sum(axis=1)
+                counts[row:end] += matched @ y_block
+        return covered, counts
+
+    def nbytes(self):
+        return sum(array.nbytes for array in [self.lower, self.upper, self.specified, self.labels, self.precision] +
+                   [getattr(self, name) for name in COLUMNS])
@@ -4,85 +4,211 @@
 # snazmi@aggies.ncat.edu.
 #
 # ------------------------------------------------------------------------------
-from numpy import argmax, zeros, exp, nan_to_num
-from sklearn.metrics import roc_curve, precision_recall_curve
+from numpy import argmax, zeros, exp, nan_to_num, where, diff, flatnonzero, searchsorted, add, maximum, \
+    minimum, logical_or, inf, lexsort, unique, bincount, repeat, arange, argsort, take_along_axis, \
+    put_along_axis, ones, errstate, asarray, floor, concatenate, vstack
 
 from config import *
-
-
-def max_prediction(matching_cls, randint_func):
-    tiebreak_numerosity = {}
-    prediction = set()
-    vote = {}
-
-    def update_value(cl):
-        lp = cl.prediction
-        if vote.get(tuple(lp)):
-            vote[tuple(lp)] += cl.fitness * cl.numerosity
-            tiebreak_numerosity[tuple(lp)] += cl.numerosity
-        else:
-            vote[tuple(lp)] = cl.fitness * cl.numerosity
-            tiebreak_numerosity[tuple(lp)] = cl.numerosity
-
-    [update_value(cl) for cl in matching_cls]
-    max_vote = max(vote.values())
-
-    if max_vote == 0:
-        [prediction.add(label) for label in list(vote.keys())
-            [randint_func(0, vote.keys().__len__() - 1)]]
-        return prediction
-    candidate_lp = [lp for lp, v in vote.items() if v == max_vote]
-    if candidate_lp.__len__() > 1:
-        max_numerosity = max([tiebreak_numerosity[lp] for lp in candidate_lp])
-        candidate_lp = [lp for lp in candidate_lp if tiebreak_numerosity[lp] == max_numerosity]
-        if candidate_lp.__len__() > 1:
-            [prediction.add(label) for label in candidate_lp[randint_func(0, candidate_lp.__len__() - 1)]]
+from match_engine import BATCH_CELLS
+from population_store import unpack_label_set
+
+
+def aggregate_votes(match_matrix, precision, predicted):
+    """
+    Votes of the rules matching each row of a samples x rules match matrix (scipy csr, any stored entry is a
+    match) given the population's rules x labels precision and 0/1 prediction matrices. A label some matching
+    rule predicts gets the best nonzero precision for it among the matching rules, scaled by the sigmoid
+    1 / (1 + exp(-10 * (r - 0.5))) of the share r of matching rules with a nonzero precision for it, or 0
+    when there is none. Returns the samples x labels votes and the mask of labels some matching rule predicts.
+    Works through blocks of at most BATCH_CELLS gathered rule rows.
+    """
+    indptr, indices = match_matrix.indptr, match_matrix.indices
+    n_samples, n_labels = indptr.__len__() - 1, precision.shape[1]
+    votes = zeros((n_samples, n_labels))
+    labels = zeros((n_samples, n_labels), dtype=bool)
+    step = max(1, BATCH_CELLS // max(1, n_labels))
+    start = 0
+    while start < n_samples:
+        end = min(n_samples, max(start + 1, searchsorted(indptr, indptr[start] + step, side='right') - 1))
+        counts = diff(indptr[start:end + 1])
+        rows = flatnonzero(counts)
+        if rows.__len__() > 0:
+            first = indptr[start]
+            offsets = indptr[start:end][rows] - first
+            rules = indices[first:indptr[end]]
+            pr = precision[rules]
+            voted = pr != 0
+            n_votes = add.reduceat(voted.astype(int), offsets, axis=0)
+            best = maximum.reduceat(where(voted, pr, -inf), offsets, axis=0)
+            mask = logical_or.reduceat(predicted[rules], offsets, axis=0)
+            n_ratio = n_votes / counts[rows][:, None]
+            coef = 1 / (1 + exp(-10 * (n_ratio - 0.5)))
+            votes[start + rows] = where(mask & (n_votes > 0), best * coef, 0.0)
+            labels[start + rows] = mask
+        start = end
+    return votes, labels
+
+
+def max_predictions(match_matrix, labels, fitness, numerosity, randint_func):
+    """
+    Label set predicted for every row of a samples x rules match matrix whose entries are the 1-based positions
+    of the rules in each sample's matchset (see ClassifierSets.make_eval_matchsets), given the population's
+    packed labels, fitness and numerosity arrays. Each label set predicted by matching rules gets their summed
+    fitness x numerosity as vote; ties on the highest vote go to the larger summed numerosity, then to a draw
+    among the label sets left in the order they first appear in the matchset, and with all votes at 0 the draw
+    is over all of them. randint_func is only called for the samples left with a tie, in sample order.
+    Returns one LabelSet per sample, None where nothing matched.
+    """
+    n_samples = match_matrix.shape[0]
+    sample = repeat(arange(n_samples), diff(match_matrix.indptr))
+    order = lexsort((match_matrix.data, sample))
+    sample, rules = sample[order], match_matrix.indices[order]
+    predictions = [None] * n_samples
+    if rules.__len__() == 0:
+        return predictions
+    keys, rule_key = unique(labels, axis=0, return_inverse=True)
+    key = rule_key.ravel()[rules]
+    # one group per (sample, label set), numbered by first appearance in the sample's matchset
+    _, first, group = unique(sample * keys.shape[0] + key, return_index=True, return_inverse=True)
+    order = first.argsort(kind='stable')
+    group = order.argsort(kind='stable')[group.ravel()]
+    first = first[order]
+    vote = bincount(group, weights=fitness[rules] * numerosity[rules])
+    tiebreak_numerosity = bincount(group, weights=numerosity[rules])
+    group_sample, group_key = sample[first], key[first]
+
+    n_groups = group_sample.__len__()
+    starts = flatnonzero(diff(group_sample, prepend=-1))
+    sizes = diff(starts, append=n_groups)
+    max_vote = maximum.reduceat(vote, starts)
+    candidate = vote == repeat(max_vote, sizes)
+    max_numerosity = maximum.reduceat(where(candidate, tiebreak_numerosity, -1), starts)
+    candidate &= tiebreak_numerosity == repeat(max_numerosity, sizes)
+    n_candidates = add.reduceat(candidate.astype(int), starts)
+    chosen = minimum.reduceat(where(candidate, arange(n_groups), n_groups), starts)
+    for i in flatnonzero((n_candidates > 1) | (max_vote == 0)).tolist():
+        if max_vote[i] == 0:
+            chosen[i] = starts[i] + randint_func(0, int(sizes[i]) - 1)
         else:
-            [prediction.add(label) for label in candidate_lp[0]]
-    else:
-        [prediction.add(label) for label in candidate_lp[0]]
-    return prediction
-
-
-def aggregate_prediction(matching_cls):
-    predicted_labels = set().union(*[cl.prediction for cl in matching_cls])
-
-    def sigmoid(x):
-        return 1 / (1 + exp(-10 * (x - 0.5)))
-
-    vote = dict.fromkeys(predicted_labels, 0.0)
-    for l in predicted_labels:
-        votes = [cl.label_based.get(l) for cl in matching_cls]
-        votes = [v for v in votes if v]
-        if votes:
-            n_ratio = votes.__len__()/matching_cls.__len__()
-            coef = sigmoid(n_ratio)
-            vote[l] = max(votes) * coef
-        else:
-            vote[l] = 0.0
-    # v_max = max(vote.values())
-    # vote = {k: v/v_max for k, v in vote.items()}
-    return vote
-
-
-def optimize_theta(votes, targets):
+            chosen[i] = starts[i] + flatnonzero(candidate[starts[i]:starts[i] + sizes[i]])[
+                randint_func(0, int(n_candidates[i]) - 1)]
+    label_sets = [unpack_label_set(words) for words in keys]
+    for s, k in zip(group_sample[starts].tolist(), group_key[chosen].tolist()):
+        predictions[s] = label_sets[k]
+    return predictions
+
+
+def label_curves(votes, targets):
+    """
+    Operating points of every label's votes against its 0/1 targets, from one descending sort per column:
+    for each distinct vote, highest first, the true and false positives of predicting the label at that
+    vote or above, as sklearn's precision_recall_curve and roc_curve count them. Returns one
+    (thresholds, tps, fps) triple per label, shared by optimize_theta and Performance.roc.
+    """
+    order = argsort(-votes, axis=0, kind='stable')
+    scores = take_along_axis(votes, order, axis=0)
+    hits = take_along_axis(targets.astype(float), order, axis=0).cumsum(axis=0)
+    ends = ones(scores.shape, dtype=bool)
+    ends[:-1] = scores[:-1] != scores[1:]
+    curves = []
+    for l in range(votes.shape[1]):
+        idx = flatnonzero(ends[:, l])
+        tps = hits[idx, l]
+        curves.append((scores[idx, l], tps, idx + 1 - tps))
+    return curves
+
+
+class LabelHistograms:
+    """
+    Streaming histograms of every label's votes in constant memory: disjoint vote ranges [low, high] in
+    ascending order, with the positive and negative samples falling in each. A chunk's distinct votes join
+    the range holding them or become ranges of their own, so a label with at most `bins` distinct votes is
+    kept exactly. Past `bins` ranges, runs of neighbouring ranges holding fewer than n / bins samples each
+    (n the samples seen so far) are merged into ranges of fewer than 2n / bins samples, which keeps at most
+    3 * bins + 1 of them and puts the finest ranges where the votes are dense.
+    The range lows are operating points of label_curves, so every threshold found on the curves is one of
+    the exact ones; theta_error and auc_error bound what the merged ranges can cost.
+    """
+    def __init__(self, n_labels=NO_LABELS, bins=SCORE_BINS):
+        self.n_labels = n_labels
+        self.bins = bins
+        self.count = 0
+        self.ranges = [zeros((4, 0)) for _ in range(n_labels)]  # rows: low, high, positives, negatives
+
+    def add(self, votes, targets):
+        self.count += votes.shape[0]
+        for l in range(self.n_labels):
+            self.ranges[l] = self.add_label(self.ranges[l], votes[:, l], targets[:, l].astype(bool))
+
+    def add_label(self, ranges, votes, targets):
+        values, inverse = unique(votes, return_inverse=True)
+        positive = bincount(inverse.ravel(), weights=targets, minlength=values.__len__())
+        negative = bincount(inverse.ravel(), minlength=values.__len__()) - positive
+        at = searchsorted(ranges[0], values, side='right') - 1
+        inside = (at >= 0) & (values <= ranges[1][maximum(at, 0)]) if ranges.shape[1] else zeros(values.shape, bool)
+        ranges = ranges.copy()
+        add.at(ranges[2], at[inside], positive[inside])
+        add.at(ranges[3], at[inside], negative[inside])
+        ranges = concatenate([ranges, vstack([values, values, positive, negative])[:, ~inside]], axis=1)
+        ranges = ranges[:, argsort(ranges[0], kind='stable')]
+        if ranges.shape[1] > self.bins:
+            ranges = self.merge(ranges)
+        return ranges
+
+    def merge(self, ranges):
+        limit = self.count / self.bins
+        counts = ranges[2] + ranges[3]
+        large = counts >= limit
+        slot = floor((counts.cumsum() - counts) / limit)
+        starts = ones(counts.shape, dtype=bool)
+        starts[1:] = large[1:] | large[:-1] | (slot[1:] != slot[:-1])
+        starts = flatnonzero(starts)
+        return vstack([ranges[0][starts], maximum.reduceat(ranges[1], starts),
+                       add.reduceat(ranges[2], starts), add.reduceat(ranges[3], starts)])
+
+    def curves(self):
+        """ (thresholds, tps, fps) of every label at its range lows, highest first, as label_curves. """
+        return [(ranges[0, ::-1], ranges[2, ::-1].cumsum(), ranges[3, ::-1].cumsum()) for ranges in self.ranges]
+
+    def theta_error(self):
+        """
+        Bound on the F-score a label's threshold gives up against the exact F-score optimal one, mean over the
+        labels. A cut inside a merged range keeps at most its positives and drops at least none of its negatives
+        above the range low, so its F-score is at most 2 tps / (tps + fps - negatives + positives of the label).
+        """
+        error = zeros(self.n_labels)
+        for l, (ranges, (_, tps, fps)) in enumerate(zip(self.ranges, self.curves())):
+            merged = (ranges[0] < ranges[1])[::-1]
+            if not merged.any() or tps[-1] == 0:
+                continue
+            best = (2 * tps / (tps + fps + tps[-1])).max()
+            bound = 2 * tps / (tps + fps - ranges[3, ::-1] + tps[-1])
+            error[l] = max(0.0, bound[merged].max() - best)
+        return float(error.sum() / self.n_labels)
+
+    def auc_error(self):
+        """ Bound on the mean ROC AUC error: positives and negatives in one merged range count as half ordered. """
+        error = zeros(self.n_labels)
+        for l, ranges in enumerate(self.ranges):
+            pairs = ranges[2].sum() * ranges[3].sum()
+            if pairs > 0:
+                error[l] = (ranges[2] * ranges[3])[ranges[0] < ranges[1]].sum() / (2 * pairs)
+        return float(error.sum() / self.n_labels)
+
+
+def optimize_theta(curves):
+    """ F-score optimal threshold of every label, 1.0 for labels without positive samples. """
     theta = []
-    vote_list = zeros((votes.__len__(), NO_LABELS))
-    target_list = zeros((votes.__len__(), NO_LABELS))
-    idx = 0
-    for vote, target in zip(votes, targets):
-        for k, v in vote.items():
-            vote_list[idx][k] = v
-        for t in target:
-            target_list[idx][t] = 1
-        idx += 1
-    for l in range(NO_LABELS):
-        if sum(target_list[:, l]) == 0:
+    for thresholds, tps, fps in curves:
+        if tps.__len__() == 0 or tps[-1] == 0:
             theta.append(1.0)
-        else:
-            precision, recall, thresholds = precision_recall_curve(target_list[:, l], vote_list[:, l])
+            continue
+        precision = tps / (tps + fps)
+        recall = tps / tps[-1]
+        with errstate(divide='ignore', invalid='ignore'):
             fscore = nan_to_num((2 * precision * recall) / (precision + recall))
-            theta.append(thresholds[argmax(fscore)])
+        # the lowest of the best thresholds, as argmax over precision_recall_curve's ascending thresholds
+        theta.append(thresholds[fscore.__len__() - 1 - argmax(fscore[::-1])])
         # fpr, tpr, thresholds = roc_curve(target_list[:, l], vote_list[:, l])
         # if all(isnan(tpr)):
         #     theta.append(1.0)
@@ -95,18 +221,19 @@ def optimize_theta(votes, targets):
     return theta
 
 
-def one_threshold(vote, theta=None):
+def one_threshold(votes, voted, theta=None):
+    """ The voted labels whose vote reaches their threshold, for a samples x labels vote matrix. """
     if not theta:
         theta = [THETA] * NO_LABELS
-    prediction = set()
-    [prediction.add(label) for label in vote.keys() if vote[label] >= theta[label]]
-    return prediction
+    return voted & (votes >= asarray(theta))
 
 
-def rank_cut(vote):
-    labels_sorted = list(
-        {k: v for k, v in sorted(vote.items(), key=lambda item: item[1], reverse=True)}.keys())
-    return set(labels_sorted[0:RANK_CUT])
+def rank_cut(votes, voted, theta=None):
+    """ The RANK_CUT voted labels with the highest votes, equal votes going to the lower label. """
+    order = argsort(-where(voted, votes, -inf), axis=1, kind='stable')[:, :RANK_CUT]
+    cut = zeros(votes.shape, dtype=bool)
+    put_along_axis(cut, order, True, axis=1)
+    return cut & voted
 
 
 # p-cut
@@ -17,6 +17,7 @@ from sklearn.model_selection import train_test_split
 from sklearn.ensemble import ExtraTreesClassifier
 from skmultilearn.problem_transform import BinaryRelevance
 
+from label_set import LabelSet
 from visualization import plot_bar, plot_heatmap
 from config import *
 
@@ -53,7 +54,7 @@ class Preprocessing:
         self.label_ref = dict()
         self.distinct_lp_count = 0
         self.unseen_test_lp = []
-        self.unseen_test_labels = set()
+        self.unseen_test_labels = LabelSet()
         self.card = 0.0
         self.density = 0.0
         self.class_ratio = dict()
@@ -116,14 +117,15 @@ class Preprocessing:
                 pass
             for idx, row in data.iterrows():
                 label = [int(l) for l in row[NO_FEATURES:]]
-                label_set = set([idx for idx, val in enumerate(label) if val == 1])
+                label_set = LabelSet([idx for idx, val in enumerate(label) if val == 1])
                 label_set_list.append(label_set)
                 if label_set.__len__() < 1:  # removes samples with no label
                     drop_index.append(idx)
             X = data.iloc[:, :NO_FEATURES]
             X_stand = (X - X.mean())/X.std()
             data.iloc[:, :NO_FEATURES] = X_stand
-            data['labelset'] = label_set_list
+            # object column, pandas would turn the LabelSet ints into an int64 one
+            data['labelset'] = pd.Series(label_set_list, index=data.index, dtype=object)
             data.drop(drop_index, axis=0, inplace=True)
             return data
         except FileNotFoundError as fnferror:
@@ -190,8 +192,8 @@ class Preprocessing:
                     pass
                 else:
                     self.unseen_test_lp.append(row[1])
-        test_labels = set.union(*[row[1] for row in self.data_test_list])
-        self.unseen_test_labels = test_labels.difference(set.union(*[row[1] for row in self.data_train_list]))
+        test_labels = LabelSet.union(*[row[1] for row in self.data_test_list])
+        self.unseen_test_labels = test_labels.difference(LabelSet.union(*[row[1] for row in self.data_train_list]))
         self.print_mldp()
 
     def print_mldp(self):
@@ -0,0 +1,71 @@
+# Shabnam Nazmi.
+# Graduate research assistant at electrical and computer engineering department,
+# North Carolina A&T State University, Greensboro, NC.
+# snazmi@aggies.ncat.edu.
+#
+# ------------------------------------------------------------------------------
+import numpy as np
+
+from config import *
+
+STREAMS = ['cover', 'mutation', 'crossover', 'selection', 'deletion', 'subsumption', 'prediction', 'tracking']
+
+
+class Stream:
+    """
+    Random stream of one component. Array draws go straight to its numpy Generator; scalar draws are
+    served from a block of pre-drawn uniforms, refilled block values at a time.
+    """
+    def __init__(self, seed, block):
+        self.generator = np.random.default_rng(seed)
+        self.block = block
+        self.values = []
+        self.next = 0
+
+    def random(self, size=None):
+        if size is not None:
+            return self.generator.random(size)
+        if self.next == self.values.__len__():
+            self.values = self.generator.random(self.block).tolist()
+            self.next = 0
+        self.next += 1
+        return self.values[self.next - 1]
+
+    def integers(self, low, high, size=None):
+        return self.generator.integers(low, high, size)
+
+    def randint(self, a, b):
+        """ Integer in [a, b], both included. """
+        return a + int(self.random() * (b - a + 1))
+
+    def sample(self, population, k):
+        """ k distinct items of population, in random order (partial Fisher-Yates shuffle). """
+        pool = list(population)
+        for i in range(k):
+            j = i + int(self.random() * (pool.__len__() - i))
+            pool[i], pool[j] = pool[j], pool[i]
+        return pool[:k]
+
+    def stratified(self, strata, k):
+        """
+        Indices of k items spread over the strata in proportion to their sizes, in index order: the items are
+        ordered by stratum, shuffled within it, and taken at a stride of len(strata) / k from a random start.
+        """
+        noise = self.random(strata.__len__()).tolist()
+        order = sorted(range(strata.__len__()), key=lambda idx: (strata[idx], noise[idx]))
+        stride = strata.__len__() / k
+        start = self.random() * stride
+        return sorted(order[int(start + j * stride)] for j in range(k))
+
+
+class RandomStreams:
+    """
+    One independent Stream per component, as attributes named in STREAMS. They are spawned from
+    SeedSequence([seed, exp]) in STREAMS order, so what a component draws doesn't depend on how much the
+    others drew or in which order they run; new streams go at the end of STREAMS to keep the others as
+    they are.
+    """
+    def __init__(self, exp, seed=SEED_NUMBER, block=RANDOM_BLOCK):
+        children = np.random.SeedSequence([seed, exp]).spawn(STREAMS.__len__())
+        for name, child in zip(STREAMS, children):
+            setattr(self, name, Stream(child, block))
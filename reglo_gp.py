@@ -5,15 +5,20 @@
 #
 # ------------------------------------------------------------------------------
 
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from os.path import join, curdir
-import random
 
+import numpy as np
 from sklearn.cluster import KMeans
 
 from classifier_set import ClassifierSets
+from label_set import LabelSet
+from random_streams import RandomStreams
 from prediction import *
 from timer import Timer
 from performance import Performance, fscore
+from population_store import label_matrix
 from reporting import Reporting
 from reboot_model import RebootModel
 from visualization import plot_image, plot_graph
@@ -29,8 +34,7 @@ class REGLoGP:
         self.track_to_plot = []
         self.iteration = 1
         self.population = None
-        random.seed(SEED_NUMBER + exp)
-        self.rng = random
+        self.rng = RandomStreams(exp)
 
         try:
             track_file = join(curdir, REPORT_PATH, DATA_HEADER, "tracking_" + str(self.exp) + ".csv")
@@ -60,7 +64,7 @@ class REGLoGP:
         if REBOOT_MODEL:
             trained_model = RebootModel(self.exp, self.data.dtypes)
             pop = trained_model.get_model()
-            self.population = ClassifierSets(attribute_info=data.attribute_info, dtypes=data.dtypes, rand_func=self.rng,
+            self.population = ClassifierSets(attribute_info=data.attribute_info, dtypes=data.dtypes, rng=self.rng,
                                              sim_mode='global', sim_delta=0.9, clustering_method=None,
                                              cosine_matrix=self.data.sim_matrix, data_cov_inv=self.data.cov_inv,
                                              popset=pop)
@@ -68,7 +72,7 @@ class REGLoGP:
             self.population.pop_average_eval(self.data.no_features)
             analyze(pop, data)
         else:
-            self.population = ClassifierSets(attribute_info=data.attribute_info, dtypes=data.dtypes, rand_func=self.rng,
+            self.population = ClassifierSets(attribute_info=data.attribute_info, dtypes=data.dtypes, rng=self.rng,
                                              sim_mode='global', sim_delta=0.0, clustering_method=None,
                                              cosine_matrix=self.data.sim_matrix, data_cov_inv=self.data.cov_inv)
 
@@ -79,45 +83,67 @@ class REGLoGP:
         else:
             raise Exception("prediction threshold method unidentified!")
 
-        def track_performance(samples):
+        def track_performance(population, samples):
             f_score = 0
-            label_prediction = set()
-            for sample in samples:
-                self.population.make_eval_matchset(sample[0])
-                if not self.population.matchset:
-                    f_score += fscore(label_prediction, sample[1])
-                else:
-                    # if PREDICTION_METHOD == 1:
-                    label_prediction = max_prediction([self.population.popset[ref] for ref in
-                                                       self.population.matchset], self.rng.randint)
-                    # else:
-                    #     _, label_prediction = aggregate_prediction([self.population.popset[ref]
-                    #                                  for ref in self.population.matchset])
-                    # label_prediction = bi_partition(vote)
-                    f_score += fscore(label_prediction, sample[1])
+            label_prediction = LabelSet()
+            match_matrix = population.make_eval_matchsets([sample[0] for sample in samples])
+            predictions = population.eval_max_predictions(match_matrix, self.rng.prediction.randint)
+            for prediction, sample in zip(predictions, samples):
+                if prediction is not None:
+                    label_prediction = prediction
+                f_score += fscore(label_prediction, sample[1])
             return f_score / samples.__len__()
 
+        def subsample(samples):
+            if 0 < TRACK_SAMPLES < samples.__len__():
+                return [samples[idx] for idx in self.rng.tracking.stratified([sample[1] for sample in samples],
+                                                                             TRACK_SAMPLES)]
+            return samples
+
+        def checkpoint_scores(population):
+            return track_performance(population, tracked_test), track_performance(population, tracked_training)
+
+        def write_tracking(keep=0):
+            """ Writes the finished checkpoints in iteration order, waiting for the oldest until keep are left. """
+            while pending and (pending.__len__() > keep or pending[0][-1].done()):
+                iteration, pop_tracking, global_time, pop_plot, scores = pending.popleft()
+                test_fscore, train_fscore = scores.result()
+                self.training_track.write(str(iteration) + ", " + pop_tracking + ", "
+                                          + str("%.4f" % train_fscore) + ", "
+                                          + str("%.4f" % test_fscore) + ", "
+                                          + str("%.4f" % global_time) + "\n")
+                self.track_to_plot.append([iteration, train_fscore, test_fscore] + pop_plot)
+
+        tracked_test = subsample(samples_test)
+        tracked_training = subsample(samples_training)
+        tracker = ThreadPoolExecutor(max_workers=1) if TRACK_ASYNC else None
+        pending = deque()
         while self.iteration < (MAX_ITERATION + 1):
-            sample = samples_training[self.iteration % samples_training.__len__()]
-            self.train_iteration(sample)
+            sample_id = self.iteration % samples_training.__len__()
+            self.train_iteration(samples_training[sample_id], sample_id)
 
             if (self.iteration % TRACK_FREQ) == 0 and self.iteration > 0:
                 self.timer.start_evaluation()
-                test_fscore = track_performance(samples_test)
-                train_fscore = track_performance(samples_training)
+                if tracker:
+                    scores = tracker.submit(checkpoint_scores, self.population.frozen())
+                else:
+                    scores = Future()
+                    scores.set_result(checkpoint_scores(self.population))
                 self.population.pop_average_eval(self.data.no_features)
-                self.training_track.write(str(self.iteration) + ", " + self.population.get_pop_tracking() + ", "
-                                          + str("%.4f" % train_fscore) + ", "
-                                          + str("%.4f" % test_fscore) + ", "
-                                          + str("%.4f" % self.timer.get_global_timer()) + "\n")
+                pending.append([self.iteration, self.population.get_pop_tracking(), self.timer.get_global_timer(),
+                                [self.population.ave_fitness, float(self.population.micro_pop_size/MAX_CLASSIFIER),
+                                 float(self.population.popset.__len__()/MAX_CLASSIFIER)], scores])
+                # at most one checkpoint is scored behind training
+                write_tracking(keep=1)
                 self.timer.stop_evaluation()
 
-                self.track_to_plot.append([self.iteration, train_fscore, test_fscore, self.population.ave_fitness,
-                                           float(self.population.micro_pop_size/MAX_CLASSIFIER),
-                                           float(self.population.popset.__len__()/MAX_CLASSIFIER)])
-
             self.iteration += 1
 
+        self.timer.start_evaluation()
+        write_tracking()
+        self.timer.stop_evaluation()
+        if tracker:
+            tracker.shutdown()
         self.training_track.close()
 
         self.timer.start_evaluation()
@@ -135,9 +161,9 @@ class REGLoGP:
 
         return [test_evaluation, test_class_precision, self.track_to_plot]
 
-    def train_iteration(self, sample):
+    def train_iteration(self, sample, sample_id=None):
         self.timer.start_matching()
-        self.population.make_matchset(sample[0], sample[1], self.iteration)
+        self.population.make_matchset(sample[0], sample[1], self.iteration, sample_id)
         self.timer.stop_matching()
         self.population.update_sets(sample[1])
         self.population.make_correctset(sample[1])
@@ -158,10 +184,14 @@ class REGLoGP:
         self.population.deletion()
         self.timer.stop_deletion()
         self.population.clear_sets()
+        if SUBSUMPTION_SWEEP and self.iteration % SUBSUMPTION_SWEEP == 0:
+            self.timer.start_subsumption()
+            self.population.subsumption_sweep()
+            self.timer.stop_subsumption()
+        self.population.compact_ids()
 
     def evaluation(self, samples):
         performance = Performance()
-        vote_list = []
         self.no_match = 0
 
         if THRESHOLD == 1:
@@ -171,48 +201,65 @@ class REGLoGP:
         else:
             raise Exception("prediction threshold method unidentified!")
 
-        def get_prediction_prob(sample):
-            self.population.make_eval_matchset(sample[0])
-            vote0 = {}
-            if not self.population.matchset:
-                self.no_match += 1
-            else:
-                if PREDICTION_METHOD == 1:
-                    # TODO max prediction not consistent with the remainder
-                    label_prediction = max_prediction([self.population.popset[ref] for ref in
-                                                       self.population.matchset], self.rng.randint)
-                else:
-                    vote0 = aggregate_prediction([self.population.popset[ref] for ref
-                                                  in self.population.matchset])
-                if DEMO:
-                    self.demo(sample, vote0, self.data.sim_matrix)
-
-            vote_list.append(vote0)
-            self.population.clear_sets()
-
-        [get_prediction_prob(sample) for sample in samples]
-        target_list = [sample[1] for sample in samples]
-        theta = optimize_theta(vote_list, target_list)
-
-        for t, vote in zip(target_list, vote_list):
-            prediction = bi_partition(vote, theta)
-            performance.update_example_based(vote, prediction, t)
-            performance.update_class_based(prediction, t)
+        if 0 < EVAL_CHUNK < samples.__len__():
+            # bounded memory: the first pass only adds each label's votes to its histogram, the thresholds
+            # found on the histograms are then applied chunk by chunk in a second pass
+            histograms = LabelHistograms()
+            for start in range(0, samples.__len__(), EVAL_CHUNK):
+                votes, voted, targets = self.score_samples(samples[start:start + EVAL_CHUNK])
+                histograms.add(votes, targets)
+            curves = histograms.curves()
+            theta = optimize_theta(curves)
+            for start in range(0, samples.__len__(), EVAL_CHUNK):
+                votes, voted, targets = self.score_samples(samples[start:start + EVAL_CHUNK], first_pass=False)
+                performance.update(votes, voted, bi_partition(votes, voted, theta), targets)
+            performance.roc_auc_error = histograms.auc_error()
+            performance.theta_error = histograms.theta_error()
+        else:
+            votes, voted, targets = self.score_samples(samples)
+            curves = label_curves(votes, targets)
+            theta = optimize_theta(curves)
+            performance.update(votes, voted, bi_partition(votes, voted, theta), targets)
 
         performance.micro_average()
         performance.macro_average()
-        performance.roc(vote_list, target_list)
+        performance.roc(curves)
         multi_label_perf = performance.get_report(samples.__len__())
 
         class_precision = {}
         for label in self.data.label_ref.keys():
-            class_measure = performance.class_based_measure[label]
-            class_precision[self.data.label_ref[label]] = class_measure['TP'] / (
-                    class_measure['TP'] + class_measure['FP'] + 1)
+            class_precision[self.data.label_ref[label]] = float(performance.tp[label] / (
+                    performance.tp[label] + performance.fp[label] + 1))
         sample_coverage = 1 - (self.no_match / samples.__len__())
 
         return [multi_label_perf, class_precision, sample_coverage]
 
+    def score_samples(self, samples, first_pass=True):
+        """
+        Votes, voted labels and 0/1 targets of a batch of samples. The first pass over a sample also counts it
+        when nothing matches and shows the demo.
+        """
+        match_matrix = self.population.make_eval_matchsets([sample[0] for sample in samples])
+        if PREDICTION_METHOD == 1:
+            if first_pass:
+                # TODO max prediction not consistent with the remainder
+                label_predictions = self.population.eval_max_predictions(match_matrix, self.rng.prediction.randint)
+            votes = np.zeros((samples.__len__(), NO_LABELS))
+            voted = np.zeros((samples.__len__(), NO_LABELS), dtype=bool)
+        else:
+            votes, voted = self.population.eval_votes(match_matrix)
+        if first_pass:
+            self.no_match += int((np.diff(match_matrix.indptr) == 0).sum())
+            if DEMO:
+                for row, sample in enumerate(samples):
+                    self.population.load_eval_matchset(match_matrix, row)
+                    if self.population.matchset:
+                        labels = np.flatnonzero(voted[row])
+                        self.demo(sample, dict(zip(labels.tolist(), votes[row, labels].tolist())),
+                                  self.data.sim_matrix)
+                    self.population.clear_sets()
+        return votes, voted, label_matrix([sample[1] for sample in samples])
+
     def demo(self, sample, vote, cosine_sim):
         self.population.build_sim_graph([self.population.popset[idx] for idx in self.population.matchset],
                                         cosine_matrix=cosine_sim)
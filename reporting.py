@@ -28,6 +28,10 @@ class Reporting():
         stat_file.write("Model characterization:\n")
         stat_file.write("Macro pop size: " + str(pop.popset.__len__()) + "\tMicro pop size: " + str(pop.micro_pop_size) +
                         "\tAvg generality:" + str("%.3f" % pop.ave_generality) + "\n\n")
+        if pop.match_cache:
+            stat_file.write("Match cache hit rate: " + str("%.4f" % pop.match_cache.hit_rate()) +
+                            "\tSaved match checks: " + str(pop.match_cache.saved_checks) +
+                            "\tUpdate match checks: " + str(pop.match_cache.update_checks) + "\n\n")
 
         stat_file.write("Run time (min):\n")
         stat_file.write(timer.get_timer_report())
@@ -0,0 +1,56 @@
+# Shabnam Nazmi.
+# Graduate research assistant at electrical and computer engineering department,
+# North Carolina A&T State University, Greensboro, NC.
+# snazmi@aggies.ncat.edu.
+#
+# ------------------------------------------------------------------------------
+import numpy as np
+
+from label_set import LabelSet
+from population_store import classifier_bounds
+
+
+class SubsumptionIndex:
+    """
+    Rule ids grouped by prediction label set, with generality tested on the store's bound arrays, so one
+    broadcast covers a rule against a whole group. As in ClassifierMethods.is_more_general, a rule is more
+    general than another when its bounds contain the other's on every attribute; with unspecified
+    attributes at (-inf, inf), that also makes its specified attributes a subset of the other's.
+    """
+    def __init__(self, store):
+        self.store = store
+        self.groups = {}
+        self.keys = {}
+
+    def add(self, row):
+        key = LabelSet(self.store[row].prediction)
+        self.groups.setdefault(key, set()).add(row)
+        self.keys[row] = key
+
+    def remove(self, ref):
+        key = self.keys.pop(ref)
+        self.groups[key].discard(ref)
+        if not self.groups[key]:
+            del self.groups[key]
+
+    def reset(self):
+        self.groups = {}
+        self.keys = {}
+        [self.add(row) for row, _ in self.store.items()]
+
+    def group(self, prediction):
+        return self.groups.get(LabelSet(prediction), set())
+
+    def more_general(self, row, rows):
+        """ The rows that rule id row is more general than. """
+        rows = np.asarray(rows, dtype=int)
+        lower, upper = self.store.lower[rows], self.store.upper[rows]
+        general = ((self.store.lower[row] <= lower) & (upper <= self.store.upper[row])).all(axis=1)
+        return rows[general].tolist()
+
+    def more_general_than(self, classifier, rows):
+        """ The rows that are more general than a classifier outside the population. """
+        rows = np.asarray(rows, dtype=int)
+        lower, upper = classifier_bounds(self.store.dtypes, classifier)
+        general = ((self.store.lower[rows] <= lower) & (upper <= self.store.upper[rows])).all(axis=1)
+        return rows[general].tolist()
@@ -0,0 +1,125 @@
+# Shabnam Nazmi.
+# Graduate research assistant at electrical and computer engineering department,
+# North Carolina A&T State University, Greensboro, NC.
+# snazmi@aggies.ncat.edu.
+#
+# ------------------------------------------------------------------------------
+import numpy as np
+
+from config import *
+
+
+class SumTree:
+    """ Fenwick tree over non-negative weights: O(log n) point updates and prefix sums. """
+    def __init__(self, size):
+        self.size = size
+        self.tree = np.zeros(size + 1)
+        self.leaves = np.zeros(size)
+
+    def build(self, values):
+        self.leaves[:] = values
+        prefix = np.concatenate([[0.0], np.cumsum(self.leaves)])
+        idx = np.arange(1, self.size + 1)
+        self.tree[1:] = prefix[idx] - prefix[idx - (idx & -idx)]
+
+    def update(self, idx, value):
+        delta = value - self.leaves[idx]
+        self.leaves[idx] = value
+        i = idx + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def total(self):
+        total = 0.0
+        i = self.size
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+
+class DeletionVotes:
+    """
+    Deletion votes of the population kept in two Fenwick trees. A rule votes its average match set size
+    times its numerosity, ams * num, or ams * num ** 2 * ave_fitness / fitness once it has THETA_DEL matches
+    and a fitness below DELTA * ave_fitness * num. The vote is a + ave_fitness * b, with (a, b) =
+    (ams * num, 0) when the rule is exempt from the fitness penalty and (0, ams * num ** 2 / fitness)
+    otherwise, so ave_fitness only touches the trees for rules it moves from one case to the other. Rows
+    written through Classifier views are picked up from store.dirty; a roulette draw walks both trees at
+    once in O(log n).
+    """
+    def __init__(self, store):
+        self.store = store
+        self.capacity = 0
+        self.exempt = None
+        self.linear = None
+        self.scaled = None
+
+    def leaves(self, rows, ave_fitness):
+        store = self.store
+        fitness, numerosity = store.fitness[rows], store.numerosity[rows]
+        ave_matchset_size, match_count = store.ave_matchset_size[rows], store.match_count[rows]
+        exempt = (fitness >= ave_fitness * DELTA * numerosity) | (match_count < THETA_DEL)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            penalized = np.where(exempt, 0.0, ave_matchset_size * numerosity ** 2 / fitness)
+        return exempt, np.where(exempt, ave_matchset_size * numerosity, 0.0), penalized
+
+    def rebuild(self, ave_fitness):
+        self.capacity = self.store.capacity
+        self.linear = SumTree(self.capacity)
+        self.scaled = SumTree(self.capacity)
+        rows = np.arange(self.store.size)
+        self.exempt = np.zeros(self.capacity, dtype=bool)
+        linear = np.zeros(self.capacity)
+        scaled = np.zeros(self.capacity)
+        self.exempt[rows], linear[rows], scaled[rows] = self.leaves(rows, ave_fitness)
+        self.linear.build(linear)
+        self.scaled.build(scaled)
+        self.store.dirty.clear()
+        self.store.reordered = False
+
+    def refresh(self, rows, ave_fitness):
+        rows = np.asarray(rows, dtype=int)
+        exempt, linear, scaled = self.leaves(rows, ave_fitness)
+        for row, e, a, b in zip(rows.tolist(), exempt, linear, scaled):
+            self.exempt[row] = e
+            self.linear.update(row, a)
+            self.scaled.update(row, b)
+            self.store.dirty.discard(row)
+
+    def sync(self, ave_fitness):
+        """ Brings the trees up to date with the store and moves rules whose case changed with ave_fitness. """
+        if self.store.reordered or self.capacity != self.store.capacity:
+            self.rebuild(ave_fitness)
+            return
+        n = self.store.size
+        store = self.store
+        exempt = (store.fitness[:n] >= ave_fitness * DELTA * store.numerosity[:n]) | \
+                 (store.match_count[:n] < THETA_DEL)
+        changed = set(np.flatnonzero(exempt != self.exempt[:n]).tolist()) | store.dirty
+        if changed.__len__() > n // 8:
+            self.rebuild(ave_fitness)
+        elif changed:
+            self.refresh(sorted(changed), ave_fitness)
+
+    def total(self, ave_fitness):
+        return self.linear.total() + ave_fitness * self.scaled.total()
+
+    def sample(self, choice, ave_fitness):
+        """ First row whose cumulative vote exceeds choice. """
+        linear, scaled = self.linear.tree, self.scaled.tree
+        pos = 0
+        step = 1 << (self.capacity.bit_length() - 1)
+        while step:
+            nxt = pos + step
+            if nxt <= self.capacity:
+                weight = linear[nxt] + ave_fitness * scaled[nxt]
+                if weight <= choice:
+                    pos = nxt
+                    choice -= weight
+            step >>= 1
+        if pos >= self.store.size:
+            votes = self.linear.leaves[:self.store.size] + ave_fitness * self.scaled.leaves[:self.store.size]
+            pos = int(np.flatnonzero(votes > 0)[-1])
+        return pos
@@ -0,0 +1,110 @@
+# Shabnam Nazmi.
+# Graduate research assistant at electrical and computer engineering department,
+# North Carolina A&T State University, Greensboro, NC.
+# snazmi@aggies.ncat.edu.
+#
+# ------------------------------------------------------------------------------
+import random
+import unittest
+from copy import deepcopy
+
+import numpy as np
+
+from classifier import Classifier
+from classifier_set import ga_coverage, match
+from match_engine import SampleIndex, VectorMatcher, BitsetIndex, MatchCache
+from population_store import PopulationStore
+from test_population_store import DTYPES, random_classifier
+
+ATTRIBUTE_INFO = [[0.0, 1.0], [0.0, 1.0], [0.0, 1.0], 0, 0]
+
+
+class TestSampleIndex(unittest.TestCase):
+    def setUp(self):
+        self.dtypes = [1, 1, 0]
+        self.classifier = Classifier()
+        self.classifier.specified_atts = [0, 2]
+        self.classifier.condition = [[-0.5, 0.5], 1.0]
+
+    def test_within(self):
+        states = [[0.0, 3.0, 1.0], [0.2, -1.0, 0.0], [1.0, 0.0, 1.0], [-0.5, 9.0, 1.0]]
+        index = SampleIndex(states, 3)
+        lower = np.array([-0.5, -np.inf, 1.0])
+        upper = np.array([0.5, np.inf, 1.0])
+        self.assertEqual(index.within(lower, upper).tolist(), [0, 3])
+        self.assertTrue(index.any_within(lower, upper))
+        self.assertTrue(ga_coverage(self.classifier, states, self.dtypes, index))
+
+    def test_no_samples(self):
+        index = SampleIndex([], 3)
+        self.assertEqual(index.states.shape, (0, 3))
+        self.assertEqual(index.within(np.full(3, -np.inf), np.full(3, np.inf)).tolist(), [])
+        self.assertFalse(index.any_within(np.array([-0.5, -np.inf, 1.0]), np.array([0.5, np.inf, 1.0])))
+        self.assertFalse(ga_coverage(self.classifier, [], self.dtypes, index))
+
+
+class TestMatchers(unittest.TestCase):
+    """ Every matcher against a linear scan of the original per-rule match, through additions and removals. """
+    def setUp(self):
+        self.rng = random.Random(5)
+        self.store = PopulationStore(DTYPES, capacity=8)
+        self.originals = {}
+        self.matchers = [VectorMatcher(self.store), BitsetIndex(self.store, ATTRIBUTE_INFO, 4)]
+        self.cache = MatchCache(self.store, 6)
+        self.add_rules(60)
+        # grid values hit the bounds and bin edges exactly, -0.1 and 1.1 fall outside the attribute range
+        self.states = [[round(self.rng.uniform(-0.1, 1.1), 1) for _ in range(3)] +
+                       [float(self.rng.randint(0, 2)) for _ in range(2)] for _ in range(50)]
+        for key, state in enumerate(self.states[:10]):
+            self.cache.put(key, state, self.linear(state))
+
+    def add_rules(self, count):
+        for _ in range(count):
+            classifier = random_classifier(self.rng)
+            original = deepcopy(classifier)
+            row = self.store.add(classifier)
+            self.originals[row] = original
+            [matcher.add(row) for matcher in self.matchers]
+            self.cache.add_rule(row)
+
+    def remove_rules(self, count):
+        for row in self.rng.sample(sorted(self.originals), count):
+            self.store.remove(row)
+            [matcher.remove(row) for matcher in self.matchers]
+            self.cache.remove_rule(row)
+            del self.originals[row]
+
+    def compact(self):
+        order = self.store.compact()
+        self.originals = {row: self.originals[rule_id] for row, rule_id in enumerate(order.tolist())}
+        [matcher.reset() for matcher in self.matchers]
+        self.cache.remap(order)
+
+    def linear(self, state):
+        return [row for row in sorted(self.originals) if match(self.originals[row], state, DTYPES)]
+
+    def assert_matches(self):
+        expected = [self.linear(state) for state in self.states]
+        self.assertTrue(0 < sum(map(len, expected)) < self.states.__len__() * self.originals.__len__())
+        for matcher in self.matchers:
+            self.assertEqual([matcher.match(state) for state in self.states], expected)
+            rows, cols = matcher.match_batch(self.states)
+            self.assertEqual(list(zip(rows.tolist(), cols.tolist())),
+                             [(sample, row) for sample, matchset in enumerate(expected) for row in matchset])
+        for key in range(4, 10):  # the first four were evicted
+            self.assertEqual(self.cache.get(key), expected[key])
+        self.assertIsNone(self.cache.get(0))
+
+    def test_matchers(self):
+        self.assert_matches()
+        self.remove_rules(25)
+        self.assert_matches()
+        self.add_rules(10)
+        self.assert_matches()
+        self.remove_rules(10)
+        self.compact()
+        self.assert_matches()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+# Shabnam Nazmi.
+# Graduate research assistant at electrical and computer engineering department,
+# North Carolina A&T State University, Greensboro, NC.
+# snazmi@aggies.ncat.edu.
+#
+# ------------------------------------------------------------------------------
+import operator
+import unittest
+
+import numpy as np
+from sklearn.metrics import coverage_error, label_ranking_average_precision_score
+
+from config import NO_LABELS
+from performance import Performance, ranking_measures
+
+
+def per_sample_measures(vote, prediction, target):
+    """ Example based and ranking measures of one sample, as computed per sample before the batch update. """
+    vote0, target0 = np.zeros((1, NO_LABELS)), np.zeros((1, NO_LABELS))
+    vote0[0, list(vote.keys())] = list(vote.values())
+    target0[0, list(target)] = 1.0
+    target_complement = set(range(NO_LABELS)).difference(target)
+    loss = sum(1 for tc in target_complement for t in target if vote.get(t, 0) < vote.get(tc, -1e-5))
+    if not vote:
+        rank_loss = 1.0
+    elif target and target_complement:
+        rank_loss = loss / (target.__len__() * target_complement.__len__())
+    else:
+        rank_loss = 0.0
+    labels_max_vote = {max(vote.items(), key=operator.itemgetter(1))[0]} if vote else set()
+    union = prediction.union(target)
+    return {'em': float(prediction == target),
+            'hl': prediction.symmetric_difference(target).__len__() / NO_LABELS,
+            'pr': prediction.intersection(target).__len__() / prediction.__len__() if prediction else 0.0,
+            're': prediction.intersection(target).__len__() / target.__len__() if target else 0.0,
+            'f': 2 * prediction.intersection(target).__len__() / (prediction.__len__() + target.__len__())
+            if union else 0.0,
+            'acc': prediction.intersection(target).__len__() / union.__len__() if union else 0.0,
+            '1e': 0.0 if labels_max_vote.intersection(target) else 1.0,
+            'rl': rank_loss,
+            'cov-error': coverage_error(target0, vote0),
+            'rank-pr': label_ranking_average_precision_score(target0, vote0)}
+
+
+class TestPerformance(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        self.targets = rng.random((200, NO_LABELS)) < 0.3
+        self.targets[:5] = False  # samples without labels
+        self.votes = np.round(rng.random((200, NO_LABELS)), 1)  # ties
+        self.voted = rng.random((200, NO_LABELS)) < 0.6
+        self.voted[5:10] = False  # samples without votes
+        self.votes[~self.voted] = 0.0
+        self.votes[10:15, :3] = 0.0  # voted for with a zero vote
+        self.predictions = self.voted & (self.votes >= 0.5)
+
+    def samples(self):
+        for vote, voted, prediction, target in zip(self.votes, self.voted, self.predictions, self.targets):
+            labels = np.flatnonzero(voted).tolist()
+            yield (dict(zip(labels, vote[labels].tolist())), set(np.flatnonzero(prediction).tolist()),
+                   set(np.flatnonzero(target).tolist()))
+
+    def test_ranking_measures(self):
+        one_errors, rank_losses, coverages, rank_precisions = ranking_measures(self.votes, self.voted, self.targets)
+        for s, (vote, prediction, target) in enumerate(self.samples()):
+            expected = per_sample_measures(vote, prediction, target)
+            self.assertEqual(one_errors[s], expected['1e'])
+            self.assertAlmostEqual(rank_losses[s], expected['rl'], places=12)
+            self.assertEqual(coverages[s], expected['cov-error'])
+            self.assertAlmostEqual(rank_precisions[s], expected['rank-pr'], places=12)
+
+    def test_report(self):
+        performance = Performance()
+        for start in range(0, 200, 64):  # batches add up like one update
+            block = slice(start, start + 64)
+            performance.update(self.votes[block], self.voted[block], self.predictions[block], self.targets[block])
+        report = performance.get_report(200)
+        expected = {}
+        for vote, prediction, target in self.samples():
+            for key, value in per_sample_measures(vote, prediction, target).items():
+                expected[key] = expected.get(key, 0.0) + value / 200
+        for key, value in expected.items():
+            self.assertAlmostEqual(report[key], value, places=12, msg=key)
+        self.assertEqual(performance.tp.tolist(), (self.predictions & self.targets).sum(axis=0).tolist())
+        self.assertEqual(performance.fp.tolist(), (self.predictions & ~self.targets).sum(axis=0).tolist())
+        self.assertEqual(performance.fn.tolist(), (~self.predictions & self.targets).sum(axis=0).tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+# Shabnam Nazmi.
+# Graduate research assistant at electrical and computer engineering department,
+# North Carolina A&T State University, Greensboro, NC.
+# snazmi@aggies.ncat.edu.
+#
+# ------------------------------------------------------------------------------
+import random
+import unittest
+from copy import deepcopy
+
+import numpy as np
+
+from classifier import Classifier
+from config import BETA, NU, INIT_FITNESS, NO_LABELS
+from label_set import LabelSet
+from population_store import PopulationStore, COLUMNS
+
+DTYPES = [1, 1, 1, 0, 0]
+
+
+def random_classifier(rng):
+    """ Unbound classifier with its attributes listed in random order, as covering and the GA leave them. """
+    classifier = Classifier()
+    atts = rng.sample(range(DTYPES.__len__()), rng.randint(1, DTYPES.__len__()))
+    condition = []
+    for att in atts:
+        if DTYPES[att]:
+            low = round(rng.random(), 1)
+            condition.append([low, round(min(1.0, low + rng.random() / 2), 1)])
+        else:
+            condition.append(float(rng.randint(0, 2)))
+    classifier.specified_atts = atts
+    classifier.condition = condition
+    classifier.prediction = LabelSet(rng.sample(range(NO_LABELS), rng.randint(1, 3)))
+    classifier.label_based = {label: rng.random() for label in classifier.prediction}
+    classifier.numerosity = rng.randint(1, 5)
+    classifier.match_count = rng.randint(0, 30)
+    classifier.loss = rng.random() * classifier.match_count
+    classifier.fitness = rng.random()
+    classifier.ave_matchset_size = rng.random() * 20
+    classifier.init_time = rng.randint(0, 100)
+    classifier.ga_time = rng.randint(0, 100)
+    return classifier
+
+
+def sorted_condition(classifier):
+    pairs = sorted(zip(classifier.specified_atts, classifier.condition))
+    return [att for att, _ in pairs], [cond for _, cond in pairs]
+
+
+def update_params(rule, m_size, target):
+    """ The per-rule update the store's batch update replaced, on a dict of a rule's parameters. """
+    rule['match_count'] += 1
+    if rule['match_count'] < 1.0 / BETA:
+        rule['ave_matchset_size'] += (m_size - rule['ave_matchset_size']) / float(rule['match_count'])
+    else:
+        rule['ave_matchset_size'] += BETA * (m_size - rule['ave_matchset_size'])
+    if not set(rule['prediction']).issubset(target):
+        rule['loss'] += (set(rule['prediction']).symmetric_difference(target).__len__() / NO_LABELS)
+    rule['fitness'] = max((1 - rule['loss'] / rule['match_count']) ** NU, INIT_FITNESS)
+
+
+class TestPopulationStore(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(11)
+        self.store = PopulationStore(DTYPES, capacity=4)
+        self.originals = {}
+        for _ in range(40):
+            classifier = random_classifier(self.rng)
+            original = deepcopy(classifier)
+            self.originals[self.store.add(classifier)] = original
+
+    def assert_view(self, classifier, original):
+        atts, condition = sorted_condition(original)
+        self.assertEqual(classifier.specified_atts, atts)
+        self.assertEqual(classifier.condition, condition)
+        self.assertEqual(classifier.prediction, original.prediction)
+        for name in COLUMNS:
+            self.assertEqual(getattr(classifier, name), getattr(original, name))
+
+    def assert_stats(self):
+        live = [classifier for classifier in self.store]
+        self.assertEqual(self.store.stats.total('numerosity'), sum(cl.numerosity for cl in live))
+        self.assertAlmostEqual(self.store.stats.total('fitness'), sum(cl.fitness for cl in live))
+        self.assertAlmostEqual(self.store.stats.total('fitness_numerosity'),
+                               sum(cl.fitness * cl.numerosity for cl in live))
+        self.assertEqual(self.store.stats.total('specified'), sum(cl.specified_atts.__len__() for cl in live))
+
+    def test_views(self):
+        self.assertEqual(self.store.__len__(), 40)
+        for row, classifier in self.store.items():
+            self.assertEqual(classifier.row, row)
+            self.assert_view(classifier, self.originals[row])
+            self.assertEqual(self.store.find(self.originals[row])[0], self.store.find(classifier)[0])
+        self.assert_stats()
+
+    def test_writes(self):
+        for row, classifier in self.store.items():
+            classifier.update_numerosity(2)
+            classifier.set_fitness(classifier.fitness / 2)
+            self.originals[row].numerosity += 2
+            self.originals[row].fitness /= 2
+            self.assertEqual(self.store.numerosity[row], self.originals[row].numerosity)
+        for row, classifier in self.store.items():
+            self.assert_view(classifier, self.originals[row])
+        self.assert_stats()
+
+    def test_remove_and_compact(self):
+        removed = self.rng.sample(sorted(self.originals), 15)
+        for row in removed:
+            classifier = self.store[row]
+            self.store.remove(row)
+            self.assertIsNone(classifier.store)
+            self.assert_view(classifier, self.originals[row])
+            del self.originals[row]
+        self.assert_stats()
+        for _ in range(5):
+            classifier = random_classifier(self.rng)
+            original = deepcopy(classifier)
+            row = self.store.add(classifier)
+            self.assertIn(row, removed)
+            self.originals[row] = original
+        order = self.store.compact()
+        self.assertEqual(order.tolist(), sorted(self.originals))
+        self.assertEqual(self.store.size, 30)
+        for row, classifier in self.store.items():
+            self.assert_view(classifier, self.originals[order[row]])
+        frozen = self.store.snapshot()
+        for name in ['lower', 'upper', 'specified', 'labels', 'precision'] + list(COLUMNS):
+            self.assertTrue(np.array_equal(getattr(frozen, name), getattr(self.store, name)[:30]))
+        self.assert_stats()
+
+    def test_update_params(self):
+        rules = {row: dict({name: getattr(cl, name) for name in COLUMNS}, prediction=cl.prediction)
+                 for row, cl in self.store.items()}
+        for _ in range(30):
+            rows = sorted(self.rng.sample(sorted(rules), self.rng.randint(1, 20)))
+            target = set(self.rng.sample(range(NO_LABELS), self.rng.randint(1, 4)))
+            m_size = self.rng.randint(1, 60)
+            self.store.update_params(rows, m_size, LabelSet(target))
+            for row in rows:
+                update_params(rules[row], m_size, target)
+        for row, classifier in self.store.items():
+            for name in ['match_count', 'ave_matchset_size', 'loss', 'fitness']:
+                self.assertEqual(getattr(classifier, name), rules[row][name])
+        self.assert_stats()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+# Shabnam Nazmi.
+# Graduate research assistant at electrical and computer engineering department,
+# North Carolina A&T State University, Greensboro, NC.
+# snazmi@aggies.ncat.edu.
+#
+# ------------------------------------------------------------------------------
+import random
+import unittest
+import warnings
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.metrics import precision_recall_curve, roc_curve, auc
+
+from config import NO_LABELS
+from label_set import LabelSet
+from performance import Performance
+from population_store import pack_labels, unpack_labels
+from prediction import LabelHistograms, aggregate_votes, max_predictions, label_curves, optimize_theta, \
+    one_threshold
+
+
+def aggregate_prediction(matching):
+    """ Per-sample votes the batch aggregation replaced, over (prediction, label_based) pairs of the matchset. """
+    predicted_labels = set().union(*[prediction for prediction, _ in matching])
+    vote = dict.fromkeys(predicted_labels, 0.0)
+    for l in predicted_labels:
+        votes = [v for v in [label_based.get(l) for _, label_based in matching] if v]
+        if votes:
+            vote[l] = max(votes) * 1 / (1 + np.exp(-10 * (votes.__len__() / matching.__len__() - 0.5)))
+    return vote
+
+
+def max_prediction(matching, randint_func):
+    """ Per-sample max prediction the batch one replaced, over (prediction, fitness, numerosity) in matchset order. """
+    vote, tiebreak_numerosity = {}, {}
+    for prediction, fitness, numerosity in matching:
+        vote[prediction] = vote.get(prediction, 0) + fitness * numerosity
+        tiebreak_numerosity[prediction] = tiebreak_numerosity.get(prediction, 0) + numerosity
+    max_vote = max(vote.values())
+    if max_vote == 0:
+        return list(vote.keys())[randint_func(0, vote.keys().__len__() - 1)]
+    candidates = [lp for lp, v in vote.items() if v == max_vote]
+    max_numerosity = max([tiebreak_numerosity[lp] for lp in candidates])
+    candidates = [lp for lp in candidates if tiebreak_numerosity[lp] == max_numerosity]
+    if candidates.__len__() > 1:
+        return candidates[randint_func(0, candidates.__len__() - 1)]
+    return candidates[0]
+
+
+class TestVotes(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        self.predictions = [LabelSet(rng.sample(range(NO_LABELS), rng.randint(1, 3))) for _ in range(12)]
+        self.predictions += [self.predictions[rng.randint(0, 11)] for _ in range(24)]
+        self.label_based = [{l: rng.choice([0.0, 0.25, 0.5, 1.0]) for l in rng.sample(range(NO_LABELS), 3)}
+                            for _ in range(36)]
+        # the last six rules have no fitness, a few samples only match them
+        self.fitness = [rng.choice([0.25, 0.5, 1.0]) for _ in range(30)] + [0.0] * 6
+        self.numerosity = [rng.randint(1, 2) for _ in range(36)]
+        self.matchsets = [rng.sample(range(30), rng.randint(1, 8)) for _ in range(60)]
+        self.matchsets += [rng.sample(range(30, 36), rng.randint(1, 4)) for _ in range(6)] + [[], []]
+        indptr = np.cumsum([0] + [matchset.__len__() for matchset in self.matchsets])
+        indices = [row for matchset in self.matchsets for row in matchset]
+        positions = [position for matchset in self.matchsets for position in range(1, matchset.__len__() + 1)]
+        self.match_matrix = csr_matrix((positions, indices, indptr), shape=(self.matchsets.__len__(), 36))
+
+    def test_aggregate_votes(self):
+        precision = np.zeros((36, NO_LABELS))
+        for row, label_based in enumerate(self.label_based):
+            precision[row, list(label_based.keys())] = list(label_based.values())
+        labels = unpack_labels(np.array([pack_labels(prediction) for prediction in self.predictions]))
+        votes, voted = aggregate_votes(self.match_matrix, precision, labels)
+        for sample, matchset in enumerate(self.matchsets):
+            vote = aggregate_prediction([(self.predictions[row], self.label_based[row]) for row in matchset])
+            self.assertEqual(np.flatnonzero(voted[sample]).tolist(), sorted(vote))
+            self.assertEqual(votes[sample, sorted(vote)].tolist(), [vote[l] for l in sorted(vote)])
+            self.assertFalse(votes[sample, ~voted[sample]].any())
+
+    def test_max_predictions(self):
+        labels = np.array([pack_labels(prediction) for prediction in self.predictions])
+        predictions = max_predictions(self.match_matrix, labels, np.array(self.fitness), np.array(self.numerosity),
+                                      random.Random(9).randint)
+        randint_func = random.Random(9).randint
+        for sample, matchset in enumerate(self.matchsets):
+            if not matchset:
+                self.assertIsNone(predictions[sample])
+                continue
+            expected = max_prediction([(self.predictions[row], self.fitness[row], self.numerosity[row])
+                                       for row in matchset], randint_func)
+            self.assertEqual(predictions[sample], expected)
+
+
+class TestCurves(unittest.TestCase):
+    def test_thresholds_and_roc(self):
+        rng = np.random.default_rng(5)
+        targets = rng.random((300, NO_LABELS)) < 0.3
+        targets[:, 0] = False  # a label without positives
+        targets[:, 1] = True  # and one without negatives
+        votes = np.round(rng.random((300, NO_LABELS)) * 0.5 + 0.3 * targets, 2)  # ties
+        curves = label_curves(votes, targets)
+        performance = Performance()
+        performance.roc(curves)
+        theta, roc_auc = [], []
+        for l in range(NO_LABELS):
+            if targets[:, l].any():
+                precision, recall, thresholds = precision_recall_curve(targets[:, l], votes[:, l])
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    fscore = np.nan_to_num((2 * precision * recall) / (precision + recall))
+                theta.append(thresholds[np.argmax(fscore)])
+            else:
+                theta.append(1.0)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')  # labels 0 and 1 have an undefined curve, reported as 0
+                fpr, tpr, _ = roc_curve(targets[:, l], votes[:, l])
+            value = auc(fpr, tpr)
+            roc_auc.append(0 if np.isnan(value) else value)
+        self.assertEqual(optimize_theta(curves), theta)
+        self.assertAlmostEqual(performance.roc_auc, sum(roc_auc) / NO_LABELS, places=12)
+
+
+class TestLabelHistograms(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.targets = rng.random((600, NO_LABELS)) < 0.3
+        # votes piled up near 0, as the aggregated votes are
+        self.votes = np.round(rng.exponential(0.02, (600, NO_LABELS)) + 0.02 * self.targets, 4)
+        self.votes[rng.random(self.votes.shape) < 0.3] = 0.0
+        self.voted = np.ones(self.votes.shape, dtype=bool)
+
+    def chunked(self, bins):
+        histograms = LabelHistograms(NO_LABELS, bins)
+        for start in range(0, 600, 50):
+            histograms.add(self.votes[start:start + 50], self.targets[start:start + 50])
+        return histograms
+
+    def evaluate(self, theta, curves):
+        performance = Performance()
+        performance.update(self.votes, self.voted, one_threshold(self.votes, self.voted, theta), self.targets)
+        performance.micro_average()
+        performance.macro_average()
+        performance.roc(curves)
+        return performance
+
+    def test_exact_within_bins(self):
+        histograms = self.chunked(1000)
+        exact_curves = label_curves(self.votes, self.targets)
+        theta = optimize_theta(histograms.curves())
+        self.assertEqual(theta, optimize_theta(exact_curves))
+        self.assertEqual(histograms.theta_error(), 0.0)
+        self.assertEqual(histograms.auc_error(), 0.0)
+        self.assertEqual(self.evaluate(theta, histograms.curves()).get_report(600),
+                         self.evaluate(theta, exact_curves).get_report(600))
+
+    def test_merged_within_bounds(self):
+        histograms = self.chunked(20)
+        self.assertTrue(all(ranges.shape[1] <= 3 * 20 + 1 for ranges in histograms.ranges))
+        exact_curves = label_curves(self.votes, self.targets)
+        exact = self.evaluate(optimize_theta(exact_curves), exact_curves)
+        chunked = self.evaluate(optimize_theta(histograms.curves()), histograms.curves())
+
+        def label_fscores(performance):
+            return 2 * performance.tp / (2 * performance.tp + performance.fp + performance.fn)
+
+        loss = (label_fscores(exact) - label_fscores(chunked)).mean()
+        self.assertGreater(histograms.theta_error(), 0.0)
+        self.assertLessEqual(loss, histograms.theta_error() + 1e-12)
+        self.assertLessEqual(abs(exact.roc_auc - chunked.roc_auc), histograms.auc_error() + 1e-12)
+
+
+if __name__ == "__main__":
+    unittest.main()